@@ -46,25 +46,33 @@ import re
 import asyncio
 import time
 import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 from flask import Flask
 from dotenv import load_dotenv
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from telegram.error import RetryAfter
-from claim_coupons import claim_for_token, list_available_coupons, list_my_coupons, list_campaign_calendar, get_today_recommendation, is_mcp_error_message, is_mcp_token_error, is_mcp_server_error, reorder_calendar_sections
-from coupon_utils import get_cst_now, clean_markdown_text
+from claim_coupons import claim_for_token, list_available_coupons, list_my_coupons, list_campaign_calendar, get_today_recommendation, is_mcp_error_message, is_mcp_token_error, is_mcp_server_error, reorder_calendar_sections, mcp_pool
+from coupon_utils import get_cst_now, clean_markdown_text, check_expiring_soon, format_expiry_reminder
+from quotes import next_quote
+from notify import close_http_client
 
 def _split_into_chunks(text: str, chunk_size: int = 3500) -> list:
     parts = []
-    buf = ""
+    current, cur_len = [], 0
     for line in text.splitlines():
-        if len(buf) + len(line) + 1 > chunk_size:
-            parts.append(buf)
-            buf = ""
-        buf = (buf + "\n" + line).strip()
-    if buf:
-        parts.append(buf)
+        if cur_len + len(line) + 1 > chunk_size:
+            parts.append("\n".join(current))
+            current, cur_len = [], 0
+        # Same result as stripping the whole buffer: blank lines are dropped,
+        # only the first line of a chunk loses its leading whitespace
+        piece = line.rstrip() if current else line.strip()
+        if piece:
+            cur_len += len(piece) + (1 if current else 0)
+            current.append(piece)
+    if current:
+        parts.append("\n".join(current))
     final_parts = []
     for p in parts:
         if len(p) <= chunk_size:
@@ -104,6 +112,9 @@ async def send_chunked_update(application, chat_id, text: str, chunk_size: int =
 from telegraph_service import TelegraphService
 
 IMG_URL_RE = re.compile(r"<img[^>]*src=\"([^\"]+)\"", re.IGNORECASE)
+IMG_TAG_RE = re.compile(r"<img[^>]+>")
+MD_HEADER_RE = re.compile(r"^#+\s*")
+DATE_YMD_RE = re.compile(r'(\d{4})[-/](\d{1,2})[-/](\d{1,2})')
 
 def clean_markdown(text):
     return clean_markdown_text(text)
@@ -124,13 +135,13 @@ def build_telegraph_nodes_from_text(text: str, title: str) -> list:
         imgs = IMG_URL_RE.findall(line)
         
         # Clean text by removing image tags
-        text_content = re.sub(r"<img[^>]+>", "", line)
+        text_content = IMG_TAG_RE.sub("", line)
         cleaned_text = clean_markdown(text_content)
         
         # If there is text, add it first
         if cleaned_text and not cleaned_text.startswith("http"):
              # Remove markdown headers
-            cleaned_text = re.sub(r"^#+\s*", "", cleaned_text)
+            cleaned_text = MD_HEADER_RE.sub("", cleaned_text)
             if cleaned_text:
                 nodes.append({"tag": "p", "children": [cleaned_text]})
         
@@ -158,13 +169,13 @@ def build_today_telegraph_nodes(text: str, calendar_raw) -> list:
         imgs = IMG_URL_RE.findall(line)
         
         # Clean text by removing image tags
-        text_content = re.sub(r"<img[^>]+>", "", line)
+        text_content = IMG_TAG_RE.sub("", line)
         cleaned_text = clean_markdown(text_content)
         
         # If there is text, add it first
         if cleaned_text and not cleaned_text.startswith("http"):
              # Remove markdown headers
-            cleaned_text = re.sub(r"^#+\s*", "", cleaned_text)
+            cleaned_text = MD_HEADER_RE.sub("", cleaned_text)
             if cleaned_text:
                 nodes.append({"tag": "p", "children": [cleaned_text]})
         
@@ -178,7 +189,7 @@ def build_today_telegraph_nodes(text: str, calendar_raw) -> list:
             return None
         if not isinstance(value, str):
             value = str(value)
-        m = re.search(r'(\d{4})[-/](\d{1,2})[-/](\d{1,2})', value)
+        m = DATE_YMD_RE.search(value)
         if not m:
             return None
         year, month, day = m.groups()
@@ -260,7 +271,7 @@ def build_today_telegraph_nodes(text: str, calendar_raw) -> list:
 telegraph_service = TelegraphService()
 
 # SQLAlchemy imports
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, func, text, BigInteger
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, func, text, BigInteger, Index, bindparam, case, select, exists
 from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session
 
 # Load environment variables
@@ -335,6 +346,26 @@ async def safe_bot_send_message(bot, chat_id, text: str, **kwargs):
         except Exception:
             raise
 
+# Telegram allows roughly 30 messages per second per bot; stay a little under it
+BROADCAST_MESSAGES_PER_SECOND = 25
+
+class SendPacer:
+    """Spaces sends at least 1/rate seconds apart across every task sharing it."""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate
+        self._lock = asyncio.Lock()
+        self._next_at = 0.0
+
+    async def wait(self):
+        # The lock is held while sleeping, so waiting workers take slots in turn
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            if self._next_at > now:
+                await asyncio.sleep(self._next_at - now)
+                now = self._next_at
+            self._next_at = now + self._interval
+
 # ==================== Message Formatting Constants ====================
 
 # Emoji definitions for consistency
@@ -369,6 +400,16 @@ COMMAND_HELP_TEXT = """常用命令：
 /unbind - 解除绑定
 /admin - 管理员总览"""
 
+ACCOUNT_HELP_TEXT = (
+    "👤 多账号管理\n\n"
+    "你可以同时绑定多个麦当劳账号，并随时切换。\n\n"
+    "📋 命令列表：\n"
+    "/account add <名称> <Token> - 添加新账号\n"
+    "/account use <名称> - 切换到指定账号\n"
+    "/account list - 查看已添加的账号\n"
+    "/account del <名称> - 删除指定账号\n"
+)
+
 # Message formatting helper functions
 def format_error_msg(message: str, show_help: bool = False) -> str:
     """Format error message with consistent style."""
@@ -425,6 +466,9 @@ class User(Base):
     total_success = Column(Integer, default=0)
     total_failed = Column(Integer, default=0)
 
+    # get_all_users / get_admin_summary filter on auto_claim_enabled
+    __table_args__ = (Index("ix_user_auto_claim", "auto_claim_enabled"),)
+
 class Account(Base):
     __tablename__ = 'accounts'
     # Composite primary key manually handled or use id
@@ -435,7 +479,20 @@ class Account(Base):
     is_active = Column(Integer, default=0)
     created_at = Column(DateTime, server_default=func.now())
 
+    # Active-account lookups filter on (user_id, is_active)
+    __table_args__ = (Index("ix_account_user_active", "user_id", "is_active"),)
+
 engine = create_engine(DATABASE_URL)
+
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_conn, _):
+        # WAL lets readers run alongside a writer; NORMAL skips the per-commit fsync that FULL pays
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
 SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 
 def init_db():
@@ -463,6 +520,10 @@ def init_db():
                         conn.execute(text(stmt))
                     except Exception:
                         pass
+
+        # create_all only builds indexes together with new tables; add them to existing databases too
+        for index in (*User.__table__.indexes, *Account.__table__.indexes):
+            index.create(bind=engine, checkfirst=True)
     except Exception as e:
         logger.error(f"Database initialization error: {e}")
 
@@ -476,163 +537,272 @@ def close_db(session):
     finally:
         SessionLocal.remove()
 
-# --- Database Access Layer (Refactored to use SQLAlchemy) ---
-
-def get_active_account(user_id):
+@contextmanager
+def session_scope():
+    """Yield a session, commit on success, roll back on error and always release it."""
     session = get_db()
     try:
-        account = session.query(Account).filter(Account.user_id == user_id, Account.is_active == 1).first()
-        if account:
-            return (account.name, _decode_token(account.mcp_token))
-        return None
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
     finally:
         close_db(session)
 
+# --- Database Access Layer (Refactored to use SQLAlchemy) ---
+
 def get_accounts(user_id):
-    session = get_db()
-    try:
-        accounts = session.query(Account).filter(Account.user_id == user_id).all()
-        return [(acc.name, _decode_token(acc.mcp_token), acc.is_active) for acc in accounts]
-    finally:
-        close_db(session)
+    with session_scope() as session:
+        rows = session.execute(
+            select(Account.name, Account.mcp_token, Account.is_active)
+            .where(Account.user_id == user_id)
+            .order_by(Account.name)
+        ).all()
+        return [(name, _decode_token(token), is_active) for name, token, is_active in rows]
+
+def get_account(user_id, name):
+    with session_scope() as session:
+        account = session.get(Account, (user_id, name))
+        if account:
+            return (account.name, _decode_token(account.mcp_token), account.is_active)
+        return None
+
+def _upsert_account_in(session, user_id, name, token, set_active):
+    account = session.get(Account, (user_id, name))
+    stored_token = _encode_token(token)
+    if account:
+        account.mcp_token = stored_token
+        if set_active:
+            session.query(Account).filter(Account.user_id == user_id).update({"is_active": 0})
+            account.is_active = 1
+    else:
+        if set_active:
+            session.query(Account).filter(Account.user_id == user_id).update({"is_active": 0})
+        account = Account(user_id=user_id, name=name, mcp_token=stored_token, is_active=1 if set_active else 0)
+        session.add(account)
 
 def upsert_account(user_id, name, token, set_active):
-    session = get_db()
     try:
-        account = session.query(Account).filter(Account.user_id == user_id, Account.name == name).first()
-        stored_token = _encode_token(token)
-        if account:
-            account.mcp_token = stored_token
-            if set_active:
-                session.query(Account).filter(Account.user_id == user_id).update({"is_active": 0})
-                account.is_active = 1
-        else:
-            if set_active:
-                session.query(Account).filter(Account.user_id == user_id).update({"is_active": 0})
-            account = Account(user_id=user_id, name=name, mcp_token=stored_token, is_active=1 if set_active else 0)
-            session.add(account)
-        session.commit()
+        with session_scope() as session:
+            _upsert_account_in(session, user_id, name, token, set_active)
     except Exception as e:
-        session.rollback()
         logger.error(f"Error in upsert_account: {e}")
-    finally:
-        close_db(session)
+    _invalidate_token_cache(user_id)
 
 def set_active_account(user_id, name):
-    session = get_db()
     try:
-        session.query(Account).filter(Account.user_id == user_id).update({"is_active": 0})
-        session.query(Account).filter(Account.user_id == user_id, Account.name == name).update({"is_active": 1})
-        session.commit()
+        with session_scope() as session:
+            session.query(Account).filter(Account.user_id == user_id).update({"is_active": 0})
+            session.query(Account).filter(Account.user_id == user_id, Account.name == name).update({"is_active": 1})
     except Exception as e:
-        session.rollback()
         logger.error(f"Error in set_active_account: {e}")
-    finally:
-        close_db(session)
+    _invalidate_token_cache(user_id)
+
+def _get_user_token_in(session, user_id):
+    active = (Account.user_id == user_id) & (Account.is_active == 1)
+    query = select(
+        exists().where(active),
+        select(Account.mcp_token).where(active).limit(1).scalar_subquery(),
+        select(User.mcp_token).where(User.user_id == user_id).scalar_subquery(),
+    )
+    has_active, account_token, user_token = session.execute(query).one()
+    return _decode_token(account_token if has_active else user_token)
+
+# user_id -> (monotonic timestamp, token); every helper that changes tokens or accounts drops the entry
+_TOKEN_CACHE = {}
+_TOKEN_CACHE_TTL = 60
+
+def _invalidate_token_cache(user_id):
+    _TOKEN_CACHE.pop(user_id, None)
 
 def get_user_token(user_id):
-    active_account = get_active_account(user_id)
-    if active_account:
-        return active_account[1]
-    
-    session = get_db()
-    try:
-        user = session.query(User).filter(User.user_id == user_id).first()
-        return _decode_token(user.mcp_token) if user else None
-    finally:
-        close_db(session)
+    """Token of the active account, falling back to the legacy users.mcp_token, in one round trip."""
+    now = time.monotonic()
+    cached = _TOKEN_CACHE.get(user_id)
+    if cached and now - cached[0] < _TOKEN_CACHE_TTL:
+        return cached[1]
+    with session_scope() as session:
+        token = _get_user_token_in(session, user_id)
+    _TOKEN_CACHE[user_id] = (now, token)
+    return token
 
 def save_user_token(user_id, username, token, sync_default_account=True):
-    session = get_db()
     try:
-        user = session.query(User).filter(User.user_id == user_id).first()
-        stored_token = _encode_token(token)
-        if user:
-            user.username = username
-            user.mcp_token = stored_token
-        else:
-            user = User(user_id=user_id, username=username, mcp_token=stored_token, auto_claim_enabled=1)
-            session.add(user)
-        session.commit()
-        
-        if sync_default_account:
-            upsert_account(user_id, "default", token, True)
+        with session_scope() as session:
+            user = session.get(User, user_id)
+            stored_token = _encode_token(token)
+            if user:
+                user.username = username
+                user.mcp_token = stored_token
+            else:
+                user = User(user_id=user_id, username=username, mcp_token=stored_token, auto_claim_enabled=1)
+                session.add(user)
+            # Same session and commit as the user row: one transaction, one connection checkout
+            if sync_default_account:
+                _upsert_account_in(session, user_id, "default", token, True)
     except Exception as e:
-        session.rollback()
         logger.error(f"Error in save_user_token: {e}")
-    finally:
-        close_db(session)
+    _invalidate_token_cache(user_id)
 
 def delete_user_token(user_id):
-    session = get_db()
     try:
-        session.query(User).filter(User.user_id == user_id).delete()
-        session.query(Account).filter(Account.user_id == user_id).delete()
-        session.commit()
+        with session_scope() as session:
+            session.query(User).filter(User.user_id == user_id).delete()
+            session.query(Account).filter(Account.user_id == user_id).delete()
     except Exception as e:
-        session.rollback()
         logger.error(f"Error in delete_user_token: {e}")
+    _invalidate_token_cache(user_id)
+
+def delete_account(user_id, name, username):
+    """Delete one account and, if it was the active one, promote the next in the same transaction.
+
+    Returns None on a database error, otherwise (found, was_active, promoted_name).
+    """
+    try:
+        with session_scope() as session:
+            account = session.get(Account, (user_id, name))
+            if account is None:
+                return False, False, None
+            was_active = bool(account.is_active)
+            session.delete(account)
+            promoted = None
+            if was_active:
+                session.flush()
+                next_account = session.execute(
+                    select(Account).where(Account.user_id == user_id).order_by(Account.name).limit(1)
+                ).scalar_one_or_none()
+                if next_account:
+                    next_account.is_active = 1
+                    user = session.get(User, user_id)
+                    if user:
+                        user.username = username
+                        user.mcp_token = next_account.mcp_token
+                    else:
+                        session.add(User(user_id=user_id, username=username, mcp_token=next_account.mcp_token, auto_claim_enabled=1))
+                    promoted = next_account.name
+                else:
+                    session.query(User).filter(User.user_id == user_id).delete()
+        return True, was_active, promoted
+    except Exception as e:
+        logger.error(f"Error deleting account: {e}")
+        return None
     finally:
-        close_db(session)
+        _invalidate_token_cache(user_id)
+
+_AUTO_CLAIM_ON = User.auto_claim_enabled.is_(None) | (User.auto_claim_enabled == 1)
 
 def get_all_users():
-    session = get_db()
+    with session_scope() as session:
+        rows = session.execute(
+            select(User.user_id, User.mcp_token, User.claim_report_enabled)
+            .where(_AUTO_CLAIM_ON)
+        ).all()
+        return [(user_id, _decode_token(token), report_enabled) for user_id, token, report_enabled in rows]
+
+def get_all_user_ids():
+    """Same recipients as get_all_users, without fetching or decoding tokens."""
+    with session_scope() as session:
+        return session.execute(select(User.user_id).where(_AUTO_CLAIM_ON)).scalars().all()
+
+def get_claim_sweep_users():
+    """Everything the daily claim sweep needs per user, in one query instead of one session per user."""
+    with session_scope() as session:
+        rows = session.execute(
+            select(User.user_id, User.mcp_token, User.claim_report_enabled, User.last_claim_at, User.last_claim_success)
+            .where(_AUTO_CLAIM_ON)
+        ).all()
+        return [(user_id, _decode_token(token), report_enabled, last_claim_at, last_claim_success)
+                for user_id, token, report_enabled, last_claim_at, last_claim_success in rows]
+
+def disable_auto_claim(user_ids):
     try:
-        users = session.query(User).filter(User.auto_claim_enabled.is_(None) | (User.auto_claim_enabled == 1)).all()
-        return [(u.user_id, _decode_token(u.mcp_token), u.claim_report_enabled) for u in users]
-    finally:
-        close_db(session)
+        with session_scope() as session:
+            session.query(User).filter(User.user_id.in_(user_ids)).update(
+                {"auto_claim_enabled": 0}, synchronize_session=False
+            )
+    except Exception as e:
+        logger.error(f"Error in disable_auto_claim: {e}")
 
 def set_auto_claim_enabled(user_id, enabled):
-    session = get_db()
     try:
-        val = 1 if enabled else 0
-        session.query(User).filter(User.user_id == user_id).update({"auto_claim_enabled": val})
-        session.commit()
+        with session_scope() as session:
+            val = 1 if enabled else 0
+            session.query(User).filter(User.user_id == user_id).update({"auto_claim_enabled": val})
     except Exception as e:
-        session.rollback()
         logger.error(f"Error in set_auto_claim_enabled: {e}")
-    finally:
-        close_db(session)
 
 def set_claim_report_enabled(user_id, enabled):
-    session = get_db()
     try:
-        val = 1 if enabled else 0
-        session.query(User).filter(User.user_id == user_id).update({"claim_report_enabled": val})
-        session.commit()
+        with session_scope() as session:
+            val = 1 if enabled else 0
+            session.query(User).filter(User.user_id == user_id).update({"claim_report_enabled": val})
     except Exception as e:
-        session.rollback()
         logger.error(f"Error in set_claim_report_enabled: {e}")
-    finally:
-        close_db(session)
+
+def _user_stats_row(user):
+    if user:
+        return (user.username, user.auto_claim_enabled, user.claim_report_enabled, user.last_claim_at, 
+                user.last_claim_success, user.total_success, user.total_failed, user.created_at)
+    return None
 
 def get_user_stats_and_status(user_id):
-    session = get_db()
-    try:
-        user = session.query(User).filter(User.user_id == user_id).first()
-        if user:
-            return (user.username, user.auto_claim_enabled, user.claim_report_enabled, user.last_claim_at, 
-                    user.last_claim_success, user.total_success, user.total_failed, user.created_at)
-        return None
-    finally:
-        close_db(session)
+    with session_scope() as session:
+        return _user_stats_row(session.get(User, user_id))
+
+def get_user_bundle(user_id):
+    """(token, stats row) for the command handlers, read in one session."""
+    with session_scope() as session:
+        token = _get_user_token_in(session, user_id)
+        return token, _user_stats_row(session.get(User, user_id))
 
 def update_claim_stats(user_id, success):
-    session = get_db()
     try:
-        user = session.query(User).filter(User.user_id == user_id).first()
-        if user:
-            user.last_claim_at = get_cst_now()
-            user.last_claim_success = 1 if success else 0
-            user.total_success = (user.total_success or 0) + (1 if success else 0)
-            user.total_failed = (user.total_failed or 0) + (0 if success else 1)
-            session.commit()
+        # One UPDATE with SQL-side increments: no SELECT round trip, and concurrent claims can't lose a count
+        with session_scope() as session:
+            session.query(User).filter(User.user_id == user_id).update({
+                User.last_claim_at: get_cst_now(),
+                User.last_claim_success: 1 if success else 0,
+                User.total_success: func.coalesce(User.total_success, 0) + (1 if success else 0),
+                User.total_failed: func.coalesce(User.total_failed, 0) + (0 if success else 1),
+            }, synchronize_session=False)
     except Exception as e:
-        session.rollback()
         logger.error(f"Error in update_claim_stats: {e}")
-    finally:
-        close_db(session)
+
+def record_claim_results(results):
+    """Apply a sweep's (user_id, success, claimed_at) results as one executemany UPDATE in a single transaction."""
+    if not results:
+        return
+    users = User.__table__
+    stmt = (
+        users.update()
+        .where(users.c.user_id == bindparam("uid"))
+        .values(
+            last_claim_at=bindparam("claimed_at"),
+            last_claim_success=bindparam("ok"),
+            total_success=func.coalesce(users.c.total_success, 0) + bindparam("s"),
+            total_failed=func.coalesce(users.c.total_failed, 0) + bindparam("f"),
+        )
+    )
+    params = [
+        {"uid": user_id, "claimed_at": claimed_at, "ok": 1 if success else 0,
+         "s": 1 if success else 0, "f": 0 if success else 1}
+        for user_id, success, claimed_at in results
+    ]
+    try:
+        with session_scope() as session:
+            session.execute(stmt, params)
+    except Exception as e:
+        logger.error(f"Error in record_claim_results: {e}")
+
+# Sweep results are flushed in batches so a crashed or cancelled sweep keeps the claims it made
+CLAIM_RESULT_BATCH_SIZE = 20
+
+def flush_claim_results(claim_results):
+    """Write and clear the buffered (user_id, success, claimed_at) results."""
+    batch = claim_results[:]
+    claim_results.clear()
+    record_claim_results(batch)
 
 def _coerce_date(value):
     if value is None:
@@ -647,22 +817,22 @@ def _coerce_date(value):
     return None
 
 def get_admin_summary():
-    session = get_db()
-    try:
-        total_users = session.query(User).count()
-        auto_users = session.query(User).filter(User.auto_claim_enabled.is_(None) | (User.auto_claim_enabled == 1)).count()
-        
-        result = session.query(
-            func.sum(User.total_success),
-            func.sum(User.total_failed)
-        ).first()
+    with session_scope() as session:
+        # All four aggregates in a single pass over users
+        total_users, auto_users, total_success, total_failed = session.execute(
+            select(
+                func.count(User.user_id),
+                func.sum(case((_AUTO_CLAIM_ON, 1), else_=0)),
+                func.sum(User.total_success),
+                func.sum(User.total_failed),
+            )
+        ).one()
         
-        total_success = result[0] or 0
-        total_failed = result[1] or 0
+        auto_users = int(auto_users or 0)
+        total_success = total_success or 0
+        total_failed = total_failed or 0
         
         return total_users, auto_users, int(total_success), int(total_failed)
-    finally:
-        close_db(session)
 
 # Bot Commands
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -688,6 +858,33 @@ async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     """Alias for /start to show the menu."""
     await start(update, context)
 
+async def _bind_and_claim(update: Update, user_id, username, token) -> None:
+    """Verify a submitted token with a real claim run and bind it if it works."""
+    progress_msg = await update.message.reply_text("🔍 正在验证你的 Token，请稍等...")
+    try:
+        result = await claim_for_token(token, enable_push=False)
+
+        if is_token_invalid_result(result):
+            await update.message.reply_text(format_error_msg("Token 无效或已失效，请检查后重新发送", show_help=True))
+        elif is_server_error_result(result):
+            await update.message.reply_text(format_warning_msg("麦当劳服务暂时异常，无法验证你的 Token，请稍后再试。"))
+        elif is_result_error_message(result):
+            await update.message.reply_text(format_error_msg(f"验证失败\n{result}", show_help=True))
+        else:
+            save_user_token(user_id, username, token)
+            await update.message.reply_text(
+                format_success_msg(
+                    "Token 验证成功并已保存！",
+                    f"{SEPARATOR}\n\n{result}\n\n{SEPARATOR}\n\n⏰ 之后我会在每天 10:30 自动为你领券"
+                )
+            )
+    finally:
+        if progress_msg:
+            try:
+                await progress_msg.delete()
+            except Exception:
+                pass
+
 async def token_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     username = update.effective_user.username
@@ -702,25 +899,7 @@ async def token_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await update.message.reply_text(format_error_msg("Token 看起来太短了，请检查是否正确"))
         return
 
-    await update.message.reply_text("🔍 正在验证你的 Token，请稍等...")
-    
-    # Reuse verification logic
-    result = await claim_for_token(token, enable_push=False)
-    
-    if is_token_invalid_result(result):
-        await update.message.reply_text("❌ Token 无效或已失效，请检查后重新发送。")
-    elif is_server_error_result(result):
-        await update.message.reply_text("⚠️ 麦当劳服务暂时异常，无法验证 Token，请稍后再试。")
-    elif is_result_error_message(result):
-        await update.message.reply_text(f"❌ 验证失败。\n{result}")
-    else:
-        save_user_token(user_id, username, token)
-        await update.message.reply_text(
-            format_success_msg(
-                "Token 验证成功并已保存！",
-                f"{SEPARATOR}\n\n{result}\n\n{SEPARATOR}\n\n⏰ 之后我会在每天 10:30 自动为你领券"
-            )
-        )
+    await _bind_and_claim(update, user_id, username, token)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(
@@ -739,53 +918,13 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     username = update.effective_user.username
 
     # Handle Menu Buttons
-    if text == "🍟 立即领券":
-        await claim_command(update, context)
-        return
-    elif text == "📅 今日推荐":
-        await today_command(update, context)
-        return
-    elif text == "🎟️ 我的券包":
-        await my_coupons_command(update, context)
-        return
-    elif text == "📜 可领列表":
-        await coupons_command(update, context)
-        return
-    elif text == "📊 领券统计":
-        await stats_command(update, context)
-        return
-    elif text == "⚙️ 账号管理":
-        await account_command(update, context)
-        return
-    elif text == "ℹ️ 帮助/状态":
-        await status_command(update, context)
+    menu_handler = MENU_HANDLERS.get(text)
+    if menu_handler:
+        await menu_handler(update, context)
         return
 
     if len(text) > 20 and not text.startswith('/'):
-        progress_msg = await update.message.reply_text("🔍 正在验证你的 Token，请稍等...")
-        
-        try:
-            result = await claim_for_token(text, enable_push=False)
-            
-            if is_token_invalid_result(result):
-                await update.message.reply_text(format_error_msg("Token 无效或已失效，请检查后重新发送", show_help=True))
-            elif is_server_error_result(result):
-                await update.message.reply_text(format_warning_msg("麦当劳服务暂时异常，无法验证你的 Token，请稍后再试。"))
-            elif is_result_error_message(result):
-                await update.message.reply_text(format_error_msg(f"验证失败\n{result}", show_help=True))
-            else:
-                save_user_token(user_id, username, text)
-                await update.message.reply_text(
-                    f"✅ Token 验证成功并已保存！\n\n"
-                    f"我已经帮你执行了一次领券：\n{result}\n\n"
-                    f"之后我会在每天 10:30 自动为你领券。"
-                )
-        finally:
-            if progress_msg:
-                try:
-                    await progress_msg.delete()
-                except Exception:
-                    pass
+        await _bind_and_claim(update, user_id, username, text)
     else:
         await update.message.reply_text("❓ 没看懂，你可以直接把 MCP Token 发给我完成绑定。")
 
@@ -808,7 +947,7 @@ async def claim_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             update_claim_stats(user_id, False)
             await update.message.reply_text("❌ 你的 Token 已失效或无效，请重新发送新的 Token 完成绑定。")
         elif server_error:
-            display_result = re.sub(r'^\[(TOKEN_ERROR|SERVER_ERROR)\]\s*', '', str(result or ''))
+            display_result = ERROR_TAG_PREFIX_RE.sub('', str(result or ''))
             await update.message.reply_text(f"⚠️ 麦当劳服务暂时异常，请稍后再试。\n\n{sanitize_text(display_result)}")
         else:
             update_claim_stats(user_id, success)
@@ -919,10 +1058,15 @@ async def calendar_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             except Exception:
                 pass
 
+ERROR_TAG_RE = re.compile(r'\[(TOKEN_ERROR|SERVER_ERROR)\]\s*')
+ERROR_TAG_PREFIX_RE = re.compile(r'^\[(TOKEN_ERROR|SERVER_ERROR)\]\s*')
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+MD_HEADER_MULTILINE_RE = re.compile(r"^#+\s*", re.MULTILINE)
+
 def sanitize_text(text: str) -> str:
     if not text:
         return ""
-    text = re.sub(r'\[(TOKEN_ERROR|SERVER_ERROR)\]\s*', '', text)
+    text = ERROR_TAG_RE.sub('', text)
     cleaned_lines = []
     for line in text.splitlines():
         l = line.strip()
@@ -931,14 +1075,15 @@ def sanitize_text(text: str) -> str:
         if l.startswith("http") or "<img" in l:
             continue
         # 去掉常见 HTML 标签
-        l = re.sub(r"<[^>]+>", "", l)
+        if "<" in l:
+            l = HTML_TAG_RE.sub("", l)
         # 去掉多余的反斜杠和Markdown粗体
         l = l.replace("\\", "").replace("**", "")
         cleaned_lines.append(l)
     cleaned = "\n".join(cleaned_lines)
     # 避免 Markdown 特殊字符影响，统一发送纯文本（不设置 parse_mode）
     # 但仍可简单规范标题符号
-    cleaned = re.sub(r"^#+\s*", "", cleaned, flags=re.MULTILINE)
+    cleaned = MD_HEADER_MULTILINE_RE.sub("", cleaned)
     return cleaned
 
 def strip_mcp_header(text: str) -> str:
@@ -978,6 +1123,20 @@ def is_server_error_result(result: str) -> bool:
         return True
     return False
 
+ERROR_LINE_RE = re.compile(r"(^|\n)\s*(?:❌|错误[:：]?|error[:：]?)", re.IGNORECASE)
+FAIL_COUNT_RE = re.compile(r"失败\s*[:：]\s*(\d+)")
+FAIL_COUNT_EN_RE = re.compile(r"\bfail(?:ed|ure)?\b\s*[:：]?\s*(\d+)", re.IGNORECASE)
+SUCCESS_COUNT_RE = re.compile(r"成功\s*[:：]\s*(\d+)")
+SUCCESS_COUNT_EN_RE = re.compile(r"\bsuccess\b\s*[:：]?\s*(\d+)", re.IGNORECASE)
+
+def _claim_counts(text: str):
+    """(success_count, fail_count) from a claim summary; the EN patterns are case-insensitive so no lowered copy is needed."""
+    fail_match = FAIL_COUNT_RE.search(text) or FAIL_COUNT_EN_RE.search(text)
+    success_match = SUCCESS_COUNT_RE.search(text) or SUCCESS_COUNT_EN_RE.search(text)
+    success_count = int(success_match.group(1)) if success_match else 0
+    fail_count = int(fail_match.group(1)) if fail_match else 0
+    return success_count, fail_count
+
 def is_result_error_message(result: str) -> bool:
     """判断结果是否为任何类型的错误（Token 失效 或 服务器错误 或 领券失败）"""
     if result is None:
@@ -988,46 +1147,16 @@ def is_result_error_message(result: str) -> bool:
     if is_mcp_error_message(text):
         return True
 
-    if re.search(r"(^|\n)\s*(?:❌|错误[:：]?|error[:：]?)", text, re.IGNORECASE):
+    if ERROR_LINE_RE.search(text):
         return True
 
-    lower = text.lower()
-    fail_match = (
-        re.search(r"失败\s*[:：]\s*(\d+)", text) or
-        re.search(r"\bfail(?:ed|ure)?\b\s*[:：]?\s*(\d+)", lower)
-    )
-    success_match = (
-        re.search(r"成功\s*[:：]\s*(\d+)", text) or
-        re.search(r"\bsuccess\b\s*[:：]?\s*(\d+)", lower)
-    )
-    if fail_match and int(fail_match.group(1)) > 0:
-        success_count = int(success_match.group(1)) if success_match else 0
-        if success_count == 0:
-            return True
-    return False
+    success_count, fail_count = _claim_counts(text)
+    return fail_count > 0 and success_count == 0
 
 def is_claim_success_result(result: str) -> bool:
     """判断领券是否成功（服务器错误视为不确定，不算成功也不算失败）"""
-    if is_result_error_message(result):
-        return False
-    text = str(result)
-    lower = text.lower()
-    success_match = (
-        re.search(r"成功\s*[:：]\s*(\d+)", text) or
-        re.search(r"\bsuccess\b\s*[:：]?\s*(\d+)", lower)
-    )
-    fail_match = (
-        re.search(r"失败\s*[:：]\s*(\d+)", text) or
-        re.search(r"\bfail(?:ed|ure)?\b\s*[:：]?\s*(\d+)", lower)
-    )
-    if success_match or fail_match:
-        success_count = int(success_match.group(1)) if success_match else 0
-        fail_count = int(fail_match.group(1)) if fail_match else 0
-        if success_count == 0 and fail_count > 0:
-            return False
-        if success_count > 0:
-            return True
-    return True
+    # "0 success, >0 failed" is already reported as an error, so any non-error result counts as success
+    return not is_result_error_message(result)
 
 async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
@@ -1167,8 +1296,7 @@ async def unbind_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    token = get_user_token(user_id)
-    row = get_user_stats_and_status(user_id)
+    token, row = get_user_bundle(user_id)
 
     if not token or not row:
         await update.message.reply_text(format_warning_msg("你还没有绑定 MCP Token，请先把 Token 发给我"))
@@ -1212,8 +1340,7 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    token = get_user_token(user_id)
-    row = get_user_stats_and_status(user_id)
+    token, row = get_user_bundle(user_id)
 
     if not token or not row:
         await update.message.reply_text(format_warning_msg("暂无数据，你还没有绑定 MCP Token 或从未领过券"))
@@ -1254,14 +1381,13 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 async def autoclaim_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    token = get_user_token(user_id)
+    token, row = get_user_bundle(user_id)
 
     if not token:
         await update.message.reply_text("⚠️ 你还没有绑定 MCP Token，请先把 Token 发给我。")
         return
 
     args = context.args
-    row = get_user_stats_and_status(user_id)
 
     if not args:
         auto_claim_enabled = None
@@ -1292,14 +1418,13 @@ async def autoclaim_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def autoclaimreport_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    token = get_user_token(user_id)
+    token, row = get_user_bundle(user_id)
 
     if not token:
         await update.message.reply_text("⚠️ 你还没有绑定 MCP Token，请先把 Token 发给我。")
         return
 
     args = context.args
-    row = get_user_stats_and_status(user_id)
     
     # row = (username, auto_claim_enabled, claim_report_enabled, ...)
     # Wait, I updated get_user_stats_and_status to return 8 items.
@@ -1340,127 +1465,102 @@ async def cleartoken_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Alias for unbind but emphasizes clearing all data."""
     await unbind_command(update, context)
 
+async def _account_add(update: Update, context: ContextTypes.DEFAULT_TYPE, args, user_id) -> None:
+    if len(args) < 3:
+        await update.message.reply_text("❌ 格式错误\n请使用：/account add <名称> <Token>")
+        return
+    name = args[1]
+    new_token = " ".join(args[2:])
+    if len(new_token) < 20:
+         await update.message.reply_text("❌ Token 无效或太短，请检查。")
+         return
+    
+    # Verify token validity before adding
+    await update.message.reply_text(f"🔍 正在验证账号 {name} 的 Token...")
+    result = await claim_for_token(new_token, enable_push=False)
+    
+    if is_token_invalid_result(result):
+        await update.message.reply_text("❌ Token 无效或已失效，账号未添加。请检查后重试。")
+        return
+    if is_server_error_result(result):
+        await update.message.reply_text("⚠️ 麦当劳服务暂时异常，无法验证 Token，请稍后再试。")
+        return
+    if is_result_error_message(result):
+        await update.message.reply_text(f"❌ Token 验证失败，账号未添加。\n错误信息：{result}")
+        return
+
+    upsert_account(user_id, name, new_token, True)
+    save_user_token(user_id, update.effective_user.username, new_token, sync_default_account=False)
+    await update.message.reply_text(f"✅ 账号 {name} 添加成功并设为当前账号！")
+
+async def _account_use(update: Update, context: ContextTypes.DEFAULT_TYPE, args, user_id) -> None:
+    if len(args) < 2:
+        await update.message.reply_text("❌ 格式错误\n请使用：/account use <名称>")
+        return
+    name = args[1]
+    target = get_account(user_id, name)
+    if not target:
+        await update.message.reply_text(f"❌ 未找到名为 {name} 的账号。")
+        return
+    if not target[1]:
+        await update.message.reply_text("⚠️ 该账号的 Token 无法读取（可能启用了 MCD_TOKEN_SECRET 但当前未设置）。请先配置正确的密钥。")
+        return
+    set_active_account(user_id, name)
+    save_user_token(user_id, update.effective_user.username, target[1], sync_default_account=False)
+    await update.message.reply_text(f"✅ 已切换到账号 {name}。")
+
+async def _account_list(update: Update, context: ContextTypes.DEFAULT_TYPE, args, user_id) -> None:
+    accounts = get_accounts(user_id)
+    if not accounts:
+        await update.message.reply_text("⚠️ 你还没有添加任何账号。")
+        return
+    lines = []
+    for name, acc_token, is_active in accounts:
+        mark = "✅" if is_active else "⚪️"
+        lines.append(f"{mark} {name}")
+    await update.message.reply_text("📋 你的账号列表：\n\n" + "\n".join(lines))
+
+async def _account_del(update: Update, context: ContextTypes.DEFAULT_TYPE, args, user_id) -> None:
+    if len(args) < 2:
+        await update.message.reply_text("❌ 格式错误\n请使用：/account del <名称>")
+        return
+    name = args[1]
+    outcome = delete_account(user_id, name, update.effective_user.username)
+    if outcome is None:
+        await update.message.reply_text("❌ 删除失败，数据库错误。")
+        return
+    found, was_active, promoted = outcome
+    if not found:
+        await update.message.reply_text(f"❌ 未找到名为 {name} 的账号。")
+        return
+
+    if was_active:
+        if promoted:
+            await update.message.reply_text(f"✅ 已删除账号 {name}。\n自动切换到 {promoted}。")
+        else:
+            await update.message.reply_text(f"✅ 已删除账号 {name}。\n你当前没有绑定任何账号。")
+    else:
+        await update.message.reply_text(f"✅ 已删除账号 {name}。")
+
+# /account <sub> -> handler
+ACCOUNT_SUBCOMMANDS = {
+    "add": _account_add,
+    "use": _account_use,
+    "list": _account_list,
+    "del": _account_del,
+}
+
 async def account_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     args = context.args
     if not args:
-        msg = (
-            "👤 多账号管理\n\n"
-            "你可以同时绑定多个麦当劳账号，并随时切换。\n\n"
-            "📋 命令列表：\n"
-            "/account add <名称> <Token> - 添加新账号\n"
-            "/account use <名称> - 切换到指定账号\n"
-            "/account list - 查看已添加的账号\n"
-            "/account del <名称> - 删除指定账号\n"
-        )
-        await update.message.reply_text(msg)
+        await update.message.reply_text(ACCOUNT_HELP_TEXT)
         return
-    sub = args[0].lower()
-    if sub == "add":
-        if len(args) < 3:
-            await update.message.reply_text("❌ 格式错误\n请使用：/account add <名称> <Token>")
-            return
-        name = args[1]
-        new_token = " ".join(args[2:])
-        if len(new_token) < 20:
-             await update.message.reply_text("❌ Token 无效或太短，请检查。")
-             return
-        
-        # Verify token validity before adding
-        await update.message.reply_text(f"🔍 正在验证账号 {name} 的 Token...")
-        result = await claim_for_token(new_token, enable_push=False)
-        
-        if is_token_invalid_result(result):
-            await update.message.reply_text("❌ Token 无效或已失效，账号未添加。请检查后重试。")
-            return
-        if is_server_error_result(result):
-            await update.message.reply_text("⚠️ 麦当劳服务暂时异常，无法验证 Token，请稍后再试。")
-            return
-        if is_result_error_message(result):
-            await update.message.reply_text(f"❌ Token 验证失败，账号未添加。\n错误信息：{result}")
-            return
-
-        upsert_account(user_id, name, new_token, True)
-        save_user_token(user_id, update.effective_user.username, new_token, sync_default_account=False)
-        await update.message.reply_text(f"✅ 账号 {name} 添加成功并设为当前账号！")
-        
-    elif sub == "use":
-        if len(args) < 2:
-            await update.message.reply_text("❌ 格式错误\n请使用：/account use <名称>")
-            return
-        name = args[1]
-        accounts = get_accounts(user_id)
-        target = None
-        for acc in accounts:
-            if acc[0] == name:
-                target = acc
-                break
-        if not target:
-            await update.message.reply_text(f"❌ 未找到名为 {name} 的账号。")
-            return
-        if not target[1]:
-            await update.message.reply_text("⚠️ 该账号的 Token 无法读取（可能启用了 MCD_TOKEN_SECRET 但当前未设置）。请先配置正确的密钥。")
-            return
-        set_active_account(user_id, name)
-        save_user_token(user_id, update.effective_user.username, target[1], sync_default_account=False)
-        await update.message.reply_text(f"✅ 已切换到账号 {name}。")
-        
-    elif sub == "list":
-        accounts = get_accounts(user_id)
-        if not accounts:
-            await update.message.reply_text("⚠️ 你还没有添加任何账号。")
-            return
-        lines = []
-        for name, acc_token, is_active in accounts:
-            mark = "✅" if is_active else "⚪️"
-            lines.append(f"{mark} {name}")
-        await update.message.reply_text("📋 你的账号列表：\n\n" + "\n".join(lines))
-        
-    elif sub == "del":
-        if len(args) < 2:
-            await update.message.reply_text("❌ 格式错误\n请使用：/account del <名称>")
-            return
-        name = args[1]
-        accounts = get_accounts(user_id)
-        exists = False
-        was_active = False
-        for acc_name, acc_token, is_active in accounts:
-            if acc_name == name:
-                exists = True
-                if is_active:
-                    was_active = True
-                break
-        if not exists:
-            await update.message.reply_text(f"❌ 未找到名为 {name} 的账号。")
-            return
-        
-        session = get_db()
-        try:
-            session.query(Account).filter(Account.user_id == user_id, Account.name == name).delete()
-            session.commit()
-        except Exception as e:
-            session.rollback()
-            logger.error(f"Error deleting account: {e}")
-            await update.message.reply_text("❌ 删除失败，数据库错误。")
-            return
-        finally:
-            close_db(session)
-
-        if was_active:
-            remaining = get_accounts(user_id)
-            if remaining:
-                first_name, first_token, _ = remaining[0]
-                set_active_account(user_id, first_name)
-                save_user_token(user_id, update.effective_user.username, first_token, sync_default_account=False)
-                await update.message.reply_text(f"✅ 已删除账号 {name}。\n自动切换到 {first_name}。")
-            else:
-                delete_user_token(user_id)
-                await update.message.reply_text(f"✅ 已删除账号 {name}。\n你当前没有绑定任何账号。")
-        else:
-            await update.message.reply_text(f"✅ 已删除账号 {name}。")
-            
-    else:
+    handler = ACCOUNT_SUBCOMMANDS.get(args[0].lower())
+    if handler is None:
         await update.message.reply_text("❓ 未知子命令，请直接输入 `/account` 查看帮助。")
+        return
+    await handler(update, context, args, user_id)
 
 async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
@@ -1482,6 +1582,9 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
     args = context.args
     if args and args[0].lower() == "sweep":
+        if _claim_sweep_running:
+            await update.message.reply_text("⏳ 已有一次全量自动领券任务正在执行，请稍后再试。")
+            return
         application = context.application
         application.create_task(scheduled_job(application))
         await update.message.reply_text("🚀 已开始执行一次全量自动领券任务。")
@@ -1493,18 +1596,34 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             return
         
         message = " ".join(args[1:])
-        users = get_all_users()
-        count = 0
+        user_ids = get_all_user_ids()
         
-        await update.message.reply_text(f"📣 正在向 {len(users)} 位用户发送广播...")
+        await update.message.reply_text(f"📣 正在向 {len(user_ids)} 位用户发送广播...")
         
-        for uid, _, _ in users:
-            try:
-                await safe_bot_send_message(context.bot, uid, f"📢 管理员通知：\n\n{message}")
-                count += 1
-                await asyncio.sleep(0.1) # Avoid flooding
-            except Exception as e:
-                logger.error(f"Failed to broadcast to {uid}: {e}")
+        # A fixed pool of workers drains one shared iterator, so only 20 sends exist at a time
+        # no matter how many users there are. The shared pacer keeps the total rate under
+        # Telegram's limit; safe_bot_send_message still backs off if RetryAfter comes anyway
+        broadcast_text = f"📢 管理员通知：\n\n{message}"
+        recipients = iter(user_ids)
+        pacer = SendPacer(BROADCAST_MESSAGES_PER_SECOND)
+
+        async def _broadcast_worker():
+            sent = 0
+            for uid in recipients:
+                await pacer.wait()
+                try:
+                    result = await safe_bot_send_message(context.bot, uid, broadcast_text)
+                except Exception as e:
+                    logger.error(f"Failed to broadcast to {uid}: {e}")
+                    continue
+                # None means every attempt hit RetryAfter: nothing was delivered
+                if result is None:
+                    logger.error(f"Failed to broadcast to {uid}: still rate limited after retries")
+                    continue
+                sent += 1
+            return sent
+
+        count = sum(await asyncio.gather(*(_broadcast_worker() for _ in range(min(20, len(user_ids))))))
                 
         await update.message.reply_text(f"✅ 广播完成，成功发送给 {count} 位用户。")
         return
@@ -1521,25 +1640,25 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
     await update.message.reply_text(msg)
 
+# Reply-keyboard button text -> command handler (buttons are laid out in start())
+MENU_HANDLERS = {
+    "🍟 立即领券": claim_command,
+    "📅 今日推荐": today_command,
+    "🎟️ 我的券包": my_coupons_command,
+    "📜 可领列表": coupons_command,
+    "📊 领券统计": stats_command,
+    "⚙️ 账号管理": account_command,
+    "ℹ️ 帮助/状态": status_command,
+}
+
 # Scheduler logic
-from quotes import MCD_QUOTES
-import random
 
-async def process_user_claim(application: Application, user_id, token, report_enabled, semaphore):
+async def process_user_claim(application: Application, user_id, token, report_enabled, last_claim_at, last_claim_success, claim_results, invalid_user_ids, semaphore):
     async with semaphore:
         try:
-            try:
-                row = get_user_stats_and_status(user_id)
-                if row:
-                    last_claim_at = row[3]
-                    last_claim_success = row[4]
-                    if last_claim_success == 1:
-                        last_date = _coerce_date(last_claim_at)
-                        if last_date == get_cst_now().date():
-                            logger.info(f"Skipping auto-claim for user {user_id}: already claimed today.")
-                            return
-            except Exception as e:
-                logger.warning(f"Failed to check last claim for user {user_id}: {e}")
+            if last_claim_success == 1 and _coerce_date(last_claim_at) == get_cst_now().date():
+                logger.info(f"Skipping auto-claim for user {user_id}: already claimed today.")
+                return
 
             logger.info(f"Claiming for user {user_id}")
             result = await claim_for_token(token, enable_push=False)
@@ -1547,17 +1666,21 @@ async def process_user_claim(application: Application, user_id, token, report_en
             server_error = is_server_error_result(result)
             success = is_claim_success_result(result)
 
+            # Stats are written in batches as they pile up, plus whatever is left when the sweep
+            # ends; auto-claim switches are written in bulk once the sweep finishes
             if token_invalid:
-                update_claim_stats(user_id, False)
-                set_auto_claim_enabled(user_id, False)
+                claim_results.append((user_id, False, get_cst_now()))
+                invalid_user_ids.append(user_id)
                 logger.warning(f"Token invalid for user {user_id}, auto-claim disabled.")
             elif server_error:
                 logger.warning(f"Server error for user {user_id}, skipping stats update.")
             else:
-                update_claim_stats(user_id, success)
+                claim_results.append((user_id, success, get_cst_now()))
+            if len(claim_results) >= CLAIM_RESULT_BATCH_SIZE:
+                flush_claim_results(claim_results)
 
             if report_enabled is None or report_enabled == 1:
-                display_result = re.sub(r'^\[(TOKEN_ERROR|SERVER_ERROR)\]\s*', '', str(result or ''))
+                display_result = ERROR_TAG_PREFIX_RE.sub('', str(result or ''))
 
                 if token_invalid:
                     message = (
@@ -1572,7 +1695,7 @@ async def process_user_claim(application: Application, user_id, token, report_en
                         "自动领券仍然保持开启，明天会自动重试。"
                     )
                 elif success:
-                    quote = random.choice(MCD_QUOTES)
+                    quote = next_quote()
                     message = f"🔔 每日自动领券结果：\n\n{display_result}\n\n🍟 {quote}"
                 else:
                     message = (
@@ -1584,41 +1707,70 @@ async def process_user_claim(application: Application, user_id, token, report_en
         except Exception as e:
             logger.error(f"Failed to auto-claim for user {user_id}: {e}")
 
+# True while a claim sweep runs. Sweeps skip users by the last_claim_* values read at the start
+# and buffer their writes, so an overlapping second sweep (/admin sweep at 10:30) would claim
+# and count the same users twice
+_claim_sweep_running = False
+
 async def scheduled_job(application: Application):
+    global _claim_sweep_running
+    if _claim_sweep_running:
+        logger.warning("A claim sweep is already running; skipping this one.")
+        return
+    _claim_sweep_running = True
+    try:
+        await _run_claim_sweep(application)
+    finally:
+        _claim_sweep_running = False
+
+async def _run_claim_sweep(application: Application):
     logger.info("Running scheduled daily claim for all users...")
-    users = get_all_users()
+    users = get_claim_sweep_users()
     
     # Limit concurrency to 5 to avoid overwhelming resources
     semaphore = asyncio.Semaphore(5)
-    tasks = []
-    
-    for user_id, token, report_enabled in users:
-        if not token:
-            continue
-        tasks.append(process_user_claim(application, user_id, token, report_enabled, semaphore))
+    claim_results = []
+    invalid_user_ids = []
     
-    await asyncio.gather(*tasks)
+    # TaskGroup: if the sweep is cancelled (shutdown), every per-user task is cancelled with it.
+    # The finally still writes whatever the finished tasks collected.
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for user_id, token, report_enabled, last_claim_at, last_claim_success in users:
+                if not token:
+                    continue
+                tg.create_task(process_user_claim(application, user_id, token, report_enabled, last_claim_at, last_claim_success, claim_results, invalid_user_ids, semaphore))
+    finally:
+        flush_claim_results(claim_results)
+        if invalid_user_ids:
+            disable_auto_claim(invalid_user_ids)
     logger.info("Scheduled run complete.")
 
-async def process_user_today(application: Application, user_id, token, semaphore):
-    async with semaphore:
-        try:
+async def process_user_today(application: Application, user_id, token, semaphore, publish_semaphore):
+    # semaphore bounds the MCP calls, publish_semaphore the Telegraph/Telegram side,
+    # so a slow page upload never holds an MCP slot
+    try:
+        async with semaphore:
             logger.info(f"Generating today recommendation for user {user_id}")
-            result = await asyncio.wait_for(get_today_recommendation(token), timeout=40)
-            
-            # 检查结果是否为空或错误
-            if is_result_error_message(result):
-                await safe_bot_send_message(application.bot, user_id, "今天麦当劳 MCP 服务似乎挂了，我暂时没法生成今日推荐，可以稍后再试一次。")
-                return
-            
-            raw_calendar = await list_campaign_calendar(token, return_raw=True)
-            sanitized = sanitize_text(result)
-            
-            # 检查sanitized结果
-            if not sanitized or len(sanitized.strip()) < 10:
-                await safe_bot_send_message(application.bot, user_id, "⚠️ 今日推荐内容为空，可能是服务异常，请稍后再试。")
-                return
-            
+            async with asyncio.timeout(40):
+                result = await get_today_recommendation(token)
+            raw_calendar = None
+            if not is_result_error_message(result):
+                raw_calendar = await list_campaign_calendar(token, return_raw=True)
+
+        # 检查结果是否为空或错误
+        if is_result_error_message(result):
+            await safe_bot_send_message(application.bot, user_id, "今天麦当劳 MCP 服务似乎挂了，我暂时没法生成今日推荐，可以稍后再试一次。")
+            return
+
+        sanitized = sanitize_text(result)
+        
+        # 检查sanitized结果
+        if not sanitized or len(sanitized.strip()) < 10:
+            await safe_bot_send_message(application.bot, user_id, "⚠️ 今日推荐内容为空，可能是服务异常，请稍后再试。")
+            return
+        
+        async with publish_semaphore:
             page_url = None
             try:
                 page_url = await telegraph_service.create_page(
@@ -1634,45 +1786,44 @@ async def process_user_today(application: Application, user_id, token, semaphore
                 await safe_bot_send_message(application.bot, user_id, msg)
             else:
                 await send_chunked_update(application, user_id, sanitized)
-        except asyncio.TimeoutError:
-            await safe_bot_send_message(application.bot, user_id, "⏰ 今日推荐生成超时，稍后再试。")
-        except Exception as e:
-            logger.error(f"Failed to generate today recommendation for user {user_id}: {e}", exc_info=True)
-            await safe_bot_send_message(application.bot, user_id, "❌ 生成今日推荐时出现错误，请稍后再试。")
+    except asyncio.TimeoutError:
+        notice = "⏰ 今日推荐生成超时，稍后再试。"
+    except Exception as e:
+        logger.error(f"Failed to generate today recommendation for user {user_id}: {e}", exc_info=True)
+        notice = "❌ 生成今日推荐时出现错误，请稍后再试。"
+    else:
+        return
+    # Never let one user's failed notice escape into the TaskGroup and cancel the rest of the sweep
+    try:
+        await safe_bot_send_message(application.bot, user_id, notice)
+    except Exception as e:
+        logger.error(f"Failed to notify user {user_id} about today recommendation: {e}")
 
 async def scheduled_today_job(application: Application):
     logger.info("Running scheduled daily today-recommendation for all users...")
     users = get_all_users()
     semaphore = asyncio.Semaphore(4)
-    tasks = []
-    for user_id, token, _ in users:
-        if token:
-            tasks.append(process_user_today(application, user_id, token, semaphore))
-    await asyncio.gather(*tasks)
+    publish_semaphore = asyncio.Semaphore(10)
+    async with asyncio.TaskGroup() as tg:
+        for user_id, token, _ in users:
+            if token:
+                tg.create_task(process_user_today(application, user_id, token, semaphore, publish_semaphore))
     logger.info("Scheduled today recommendation complete.")
 
 # ==================== New Feature: Expiry Reminder ====================
-from coupon_utils import check_expiring_soon, format_expiry_reminder
 
-async def scheduled_expiry_check(application: Application):
-    """检查所有用户的优惠券过期情况并发送提醒"""
-    logger.info("Running scheduled expiry check...")
-    users = get_all_users()
-    
-    for user_id, token, _ in users:
-        if not token:
-            continue
-        
+async def process_user_expiry(application: Application, user_id, token, semaphore):
+    async with semaphore:
         try:
             # 获取用户的优惠券（获取原始数据，包含有效期信息）
             raw_coupons = await list_my_coupons(token, return_raw=True)
             if not raw_coupons:
-                continue
+                return
             
             # 转换为文本格式
             if isinstance(raw_coupons, str):
                 if is_result_error_message(raw_coupons):
-                    continue
+                    return
                 coupons_text = raw_coupons
             else:
                 coupons_text = ""
@@ -1681,7 +1832,7 @@ async def scheduled_expiry_check(application: Application):
                         coupons_text += content.text + "\n"
             
             if not coupons_text or is_mcp_error_message(coupons_text):
-                continue
+                return
             
             # 检查即将过期的券（3天内）
             expiring = check_expiring_soon(coupons_text, days_threshold=3)
@@ -1696,41 +1847,31 @@ async def scheduled_expiry_check(application: Application):
         
         # 避免请求过快
         await asyncio.sleep(0.5)
-    
-    logger.info("Scheduled expiry check complete.")
 
-async def scheduled_meal_reminder(application: Application, meal_type: str):
-    """
-    用餐时间智能提醒（午餐或晚餐）
-    
-    Args:
-        meal_type: "lunch" 或 "dinner"
-    """
-    logger.info(f"Running scheduled meal reminder ({meal_type})...")
+async def scheduled_expiry_check(application: Application):
+    """检查所有用户的优惠券过期情况并发送提醒"""
+    logger.info("Running scheduled expiry check...")
     users = get_all_users()
-    
-    # 设置问候语
-    if meal_type == "lunch":
-        greeting = "🍔 午餐时间到！"
-        time_hint = "中午"
-    else:
-        greeting = "🍗 晚餐时间到！"
-        time_hint = "晚上"
-    
-    for user_id, token, _ in users:
-        if not token:
-            continue
-        
+    # 并发受限，避免逐个用户串行等待
+    semaphore = asyncio.Semaphore(4)
+    async with asyncio.TaskGroup() as tg:
+        for user_id, token, _ in users:
+            if token:
+                tg.create_task(process_user_expiry(application, user_id, token, semaphore))
+    logger.info("Scheduled expiry check complete.")
+
+async def process_user_meal(application: Application, user_id, token, meal_type, greeting, time_hint, semaphore):
+    async with semaphore:
         try:
             # 获取用户已领取的优惠券
             raw_coupons = await list_my_coupons(token, return_raw=True)
             if not raw_coupons:
-                continue
+                return
             
             # 转换为文本格式
             if isinstance(raw_coupons, str):
                 if is_result_error_message(raw_coupons):
-                    continue
+                    return
                 coupons_text = raw_coupons
             else:
                 coupons_text = ""
@@ -1739,7 +1880,7 @@ async def scheduled_meal_reminder(application: Application, meal_type: str):
                         coupons_text += content.text + "\n"
             
             if not coupons_text or is_mcp_error_message(coupons_text):
-                continue
+                return
             
             # 解析优惠券（简单提取券名）
             available_coupons = []
@@ -1754,7 +1895,7 @@ async def scheduled_meal_reminder(application: Application, meal_type: str):
             
             # 只推送有券的用户
             if not available_coupons:
-                continue
+                return
             
             # 限制显示数量
             show_count = min(len(available_coupons), 5)
@@ -1790,12 +1931,37 @@ async def scheduled_meal_reminder(application: Application, meal_type: str):
         
         # 避免请求过快
         await asyncio.sleep(0.5)
+
+async def scheduled_meal_reminder(application: Application, meal_type: str):
+    """
+    用餐时间智能提醒（午餐或晚餐）
     
+    Args:
+        meal_type: "lunch" 或 "dinner"
+    """
+    logger.info(f"Running scheduled meal reminder ({meal_type})...")
+    users = get_all_users()
+    
+    # 设置问候语
+    if meal_type == "lunch":
+        greeting = "🍔 午餐时间到！"
+        time_hint = "中午"
+    else:
+        greeting = "🍗 晚餐时间到！"
+        time_hint = "晚上"
+    
+    semaphore = asyncio.Semaphore(4)
+    async with asyncio.TaskGroup() as tg:
+        for user_id, token, _ in users:
+            if token:
+                tg.create_task(process_user_meal(application, user_id, token, meal_type, greeting, time_hint, semaphore))
     logger.info(f"Scheduled {meal_type} reminder complete.")
 
+_scheduler_task = None
+
 async def post_init(application: Application) -> None:
     """
-    Set up bot commands menu on startup and launch the scheduler thread.
+    Set up bot commands menu on startup and launch the scheduler task.
     Called by python-telegram-bot after the event loop is running,
     so asyncio.get_running_loop() is guaranteed to return the correct loop.
     """
@@ -1821,62 +1987,88 @@ async def post_init(application: Application) -> None:
     global _bot_running
     _bot_running = True
 
-    loop = asyncio.get_running_loop()
-    threading.Thread(target=run_scheduler, args=(application, loop), daemon=True).start()
-    logger.info("Scheduler thread started from post_init.")
-
-def run_scheduler(application, loop):
+    # A plain loop task rather than application.create_task: Application.stop() awaits the
+    # latter, and this one never finishes on its own
+    global _scheduler_task
+    _scheduler_task = asyncio.get_running_loop().create_task(run_scheduler(application))
+    logger.info("Scheduler started from post_init.")
+
+async def post_shutdown(application: Application) -> None:
+    """Stop the scheduler and close pooled MCP sessions and the shared HTTP client while the event loop is still running."""
+    if _scheduler_task is not None:
+        _scheduler_task.cancel()
+    await mcp_pool.close()
+    await close_http_client()
+
+# Daily tasks (CST "HH:MM" -> job), use CST time to avoid server timezone drift
+SCHEDULE_MAP = {
+    "10:30": scheduled_job,                                      # 自动领券
+    "10:35": scheduled_today_job,                                # 今日推荐
+    "11:30": lambda app: scheduled_meal_reminder(app, "lunch"),  # 午餐提醒
+    "17:30": lambda app: scheduled_meal_reminder(app, "dinner"), # 晚餐提醒
+    "20:00": scheduled_expiry_check,                             # 过期提醒
+}
+
+def _seconds_until_next_slot(cst_now):
+    delays = []
+    for hhmm in SCHEDULE_MAP:
+        hour, minute = map(int, hhmm.split(":"))
+        slot = cst_now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if slot <= cst_now:
+            slot += timedelta(days=1)
+        delays.append((slot - cst_now).total_seconds())
+    # Re-check at least every 10 minutes so wall-clock adjustments can't make us miss a slot
+    return min(max(min(delays), 1.0), 600.0)
+
+async def run_scheduler(application):
     """
-    Runs the schedule in a separate thread.
+    Runs the daily schedule on the bot's event loop, sleeping until the next slot
+    instead of polling the clock from a separate thread.
     """
-    logger.info("Scheduler thread started")
-    
-    def job_wrapper_claim():
-        asyncio.run_coroutine_threadsafe(scheduled_job(application), loop)
-    def job_wrapper_today():
-        asyncio.run_coroutine_threadsafe(scheduled_today_job(application), loop)
-    def job_wrapper_expiry():
-        asyncio.run_coroutine_threadsafe(scheduled_expiry_check(application), loop)
-    def job_wrapper_lunch():
-        asyncio.run_coroutine_threadsafe(scheduled_meal_reminder(application, "lunch"), loop)
-    def job_wrapper_dinner():
-        asyncio.run_coroutine_threadsafe(scheduled_meal_reminder(application, "dinner"), loop)
-
-    # Schedule daily tasks (use CST time to avoid server timezone drift)
-    schedule_map = {
-        "10:30": job_wrapper_claim,   # 自动领券
-        "10:35": job_wrapper_today,   # 今日推荐
-        "11:30": job_wrapper_lunch,   # 午餐提醒
-        "17:30": job_wrapper_dinner,  # 晚餐提醒
-        "20:00": job_wrapper_expiry,  # 过期提醒
-    }
+    logger.info("Scheduler started")
     last_run = {}
 
     while True:
         cst_now = get_cst_now()
         hhmm = cst_now.strftime("%H:%M")
-        if hhmm in schedule_map:
-            last_date = last_run.get(hhmm)
-            if last_date != cst_now.date():
-                schedule_map[hhmm]()
-                last_run[hhmm] = cst_now.date()
-        time.sleep(30)
+        job = SCHEDULE_MAP.get(hhmm)
+        if job and last_run.get(hhmm) != cst_now.date():
+            last_run[hhmm] = cst_now.date()
+            application.create_task(job(application))
+        await asyncio.sleep(_seconds_until_next_slot(cst_now))
 
 # Keep-alive web server for PaaS (Koyeb/Render/HF Spaces)
 app = Flask(__name__)
 _bot_running = False
 
-@app.route('/')
-@app.route('/health')
-def health_check():
-    status = {"bot": "running" if _bot_running else "starting"}
+# PaaS platforms ping the health route every few seconds; reuse a recent DB probe instead of a SELECT per ping
+_DB_PROBE_TTL = 30
+_db_probe = (0.0, None)
+
+def _probe_db():
+    global _db_probe
+    checked_at, error = _db_probe
+    now = time.monotonic()
+    if checked_at and now - checked_at < _DB_PROBE_TTL:
+        return error
     try:
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
-        status["db"] = "ok"
+        error = None
     except Exception as e:
-        status["db"] = f"error: {e}"
+        error = str(e)
+    _db_probe = (now, error)
+    return error
+
+@app.route('/')
+@app.route('/health')
+def health_check():
+    status = {"bot": "running" if _bot_running else "starting"}
+    db_error = _probe_db()
+    if db_error is not None:
+        status["db"] = f"error: {db_error}"
         return status, 503
+    status["db"] = "ok"
     code = 200 if _bot_running else 503
     return status, code
 
@@ -1922,7 +2114,7 @@ def main():
         except ValueError:
             logger.warning("TG_CHAT_ID is not a valid integer, skipping owner auto-registration.")
 
-    application = Application.builder().token(token).post_init(post_init).build()
+    application = Application.builder().token(token).post_init(post_init).post_shutdown(post_shutdown).build()
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("menu", menu_command))
@@ -1944,7 +2136,7 @@ def main():
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
     # Start Flask server in a background thread
-    # (Scheduler thread is started in post_init after the event loop is running)
+    # (Scheduler task is started in post_init after the event loop is running)
     threading.Thread(target=run_flask, daemon=True).start()
 
     print("Bot started...")
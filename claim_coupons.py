@@ -3,18 +3,33 @@ import os
 import sys
 import time
 import re
-import random
+import json
+import hashlib
+import httpx
+from collections import OrderedDict
+from datetime import timedelta
 from dotenv import load_dotenv
 from tenacity import retry, stop_after_attempt, wait_exponential
 from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
-from notify import push_all
-from coupon_utils import get_cst_now, clean_markdown_text
+from mcp.client.streamable_http import streamable_http_client
+from notify import push_all, close_http_client
+from coupon_utils import get_cst_now, clean_markdown_text, MCP_ERROR_PREFIXES
+from quotes import next_quote
 
 load_dotenv()
 
 MCP_SERVER_URL = "https://mcp.mcd.cn/mcp-servers/mcd-mcp"
 
+_CLAIM_MARKER_RE = re.compile(r"\bcoupon\s*(?:id|code)\b|couponid|couponcode|券码|券号|兑换码", re.IGNORECASE)
+_IMG_SRC_RE = re.compile(r"<img[^>]*src=[\"'](?P<src>[^\"']+)[\"']", re.IGNORECASE)
+_SUMMARY_RE = re.compile(r"\*\*[^*]+\*\*\s*[:\uFF1A]\s*\S+")
+_KV_SPLIT_RE = re.compile(r"[:\uFF1A]")
+
+# Field keys recognised in claim results
+_CODE_KEYS = frozenset(("券码", "券号", "兑换码"))
+_IMAGE_KEYS = frozenset(("image", "img"))
+_NAME_KEYS = frozenset(("优惠券标题", "标题", "优惠券名称", "名称"))
+
 def clean_text(text):
     """Clean markdown formatting from text"""
     return clean_markdown_text(text)
@@ -28,29 +43,27 @@ def cleanup_for_telegram(text):
     
     raw_lines = text.splitlines()
 
-    # Strip tool级别的 Markdown 提示头
-    cleaned_raw = []
-    skipping_header = True
-    for line in raw_lines:
+    # Strip tool级别的 Markdown 提示头：只需找到第一行正文，之后的行原样保留
+    start = len(raw_lines)
+    for idx, line in enumerate(raw_lines):
         stripped = line.strip()
-        if skipping_header:
-            if not stripped:
-                continue
-            if "Client 支持 Markdown 渲染" in stripped:
-                continue
-            if stripped.startswith("### 当前时间") or stripped.startswith("当前时间：") or stripped.startswith("当前时间:"):
-                continue
-            skipping_header = False
-        cleaned_raw.append(line)
-    raw_lines = cleaned_raw
+        if not stripped:
+            continue
+        if "Client 支持 Markdown 渲染" in stripped:
+            continue
+        if stripped.startswith(("### 当前时间", "当前时间：", "当前时间:")):
+            continue
+        start = idx
+        break
+    if start:
+        raw_lines = raw_lines[start:]
     
     full_text = "\n".join(raw_lines)
+    # 大部分结果不带图片，整体判断一次，逐行的 <img 解析可直接跳过
+    has_img = "<img" in full_text
     # Claim result may contain "失败: 0张", so detect claim output before generic error handling.
-    claim_marker_re = re.compile(r"\bcoupon\s*(?:id|code)\b|couponid|couponcode|券码|券号|兑换码", re.IGNORECASE)
-    is_claim_result = bool(claim_marker_re.search(full_text))
-    img_re = re.compile(r"<img[^>]*src=[\"']([^\"']+)[\"']", re.IGNORECASE)
-    summary_re = re.compile(r"\*\*[^*]+\*\*\s*[:\uFF1A]\s*\S+")
-    
+    is_claim_result = bool(_CLAIM_MARKER_RE.search(full_text))
+
     if is_claim_result:
         # Format claim results: extract coupon name and code, hide technical details
         formatted_lines = []
@@ -65,7 +78,7 @@ def cleanup_for_telegram(text):
             
             # Capture header/summary lines before coupons
             if not in_coupon_section and "couponid" not in line_lower and "couponcode" not in line_lower and "图片" not in line:
-                if summary_re.search(stripped) or "###" in stripped or "领券结果" in stripped:
+                if _SUMMARY_RE.search(stripped) or "###" in stripped or "领券结果" in stripped:
                     clean_header = clean_text(stripped.lstrip("#"))
                     header_lines.append(clean_header)
                     continue
@@ -83,15 +96,15 @@ def cleanup_for_telegram(text):
                 if "couponid" in lower_content or "couponcode" in lower_content:
                     continue
 
-                if "<img" in content:
-                    m = img_re.search(content)
+                if has_img and "<img" in content:
+                    m = _IMG_SRC_RE.search(content)
                     if m:
-                        current_coupon['image'] = m.group(1)
+                        current_coupon['image'] = m.group('src')
                     if "图片" in content or lower_content.startswith(("image", "img")):
                         continue
 
                 # Check for key-value pair (support both : and fullwidth colon)
-                parts = re.split(r"[:\uFF1A]", content, maxsplit=1)
+                parts = _KV_SPLIT_RE.split(content, maxsplit=1)
                 if len(parts) == 2:
                     key = parts[0]
                     value = parts[1]
@@ -100,35 +113,35 @@ def cleanup_for_telegram(text):
                     value = value.strip()
                     key_lower = key.lower()
                     
-                    if "<img" in value:
-                        m = img_re.search(value)
+                    if has_img and "<img" in value:
+                        m = _IMG_SRC_RE.search(value)
                         if m:
-                            current_coupon['image'] = m.group(1)
+                            current_coupon['image'] = m.group('src')
                     
-                    if "couponcode" in key_lower or key in ["券码", "券号", "兑换码"]:
+                    if "couponcode" in key_lower or key in _CODE_KEYS:
                         current_coupon['code'] = clean_text(value)
                         continue
                     if "couponid" in key_lower:
                         continue
-                    if key_lower in ["image", "img"] or key in ["图片"]:
+                    if key_lower in _IMAGE_KEYS or key == "图片":
                         img_url = None
-                        m = img_re.search(value)
+                        m = _IMG_SRC_RE.search(value)
                         if m:
-                            img_url = m.group(1)
+                            img_url = m.group('src')
                         elif value.startswith("http"):
                             img_url = value.split()[0]
                         if img_url:
                             current_coupon['image'] = img_url
                         continue
                     
-                    if key in ["优惠券标题", "标题", "优惠券名称", "名称"]:
+                    if key in _NAME_KEYS:
                         current_coupon['name'] = clean_text(value)
                     # ignore couponId, couponCode, 图片 etc.
                 else:
-                    if "<img" in content:
-                        m = img_re.search(content)
+                    if has_img and "<img" in content:
+                        m = _IMG_SRC_RE.search(content)
                         if m:
-                            current_coupon['image'] = m.group(1)
+                            current_coupon['image'] = m.group('src')
                         continue
                     # No colon, assume it's the coupon name
                     # If we already have a name, it means we missed the end of the previous coupon
@@ -178,9 +191,9 @@ def cleanup_for_telegram(text):
             if "couponid" in lowered or "couponcode" in lowered:
                 continue
             if "<img" in lowered or "图片" in stripped:
-                m = img_re.search(stripped)
+                m = _IMG_SRC_RE.search(stripped)
                 if m:
-                    fallback_lines.append(f"图片: {m.group(1)}")
+                    fallback_lines.append(f"图片: {m.group('src')}")
                 continue
             fallback_lines.append(clean_text(stripped.lstrip("#")))
         return "\n".join(fallback_lines).strip()
@@ -288,18 +301,141 @@ def cleanup_for_telegram(text):
         
     return "\n".join(cleaned).strip()
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
-async def _request_mcp_with_retry(headers, tool_name, arguments):
-    start_ts = time.time()
-    async with streamablehttp_client(MCP_SERVER_URL, headers=headers) as (read, write, _):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
+class _PooledSession:
+    def __init__(self, loop):
+        self.ready = loop.create_future()
+        self.stop = asyncio.Event()
+        self.task = None
+        self.error = None
+        self.last_used = time.monotonic()
+
+
+class MCPPool:
+    """
+    按 Token 复用 MCP 会话：首次调用时建立连接并 initialize，之后的工具调用直接复用。
 
+    streamable_http_client / ClientSession 内部使用 anyio task group，必须在进入它们的
+    同一个 task 中退出，所以每个会话由一个独立的后台 task 持有，关闭时通知该 task 退出。
+    """
+
+    def __init__(self, max_sessions: int = 32, idle_timeout: float = 300):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._entries = OrderedDict()
+        self._loop = None
+        self._transport = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 每次 asyncio.run() 都是新的事件循环，旧循环里的会话和连接已随之结束
+            self._entries = OrderedDict()
+            self._transport = None
+            self._loop = loop
+        return loop
+
+    def _http_transport(self):
+        # 所有 Token 共用一个连接池；每个会话可能常驻一条 GET 推送流，所以总连接数按会话数放宽
+        if self._transport is None:
+            self._transport = httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=self.max_sessions * 2,
+                    max_keepalive_connections=10,
+                    keepalive_expiry=60.0,
+                ),
+            )
+        return self._transport
+
+    async def _run(self, entry, headers):
+        # 客户端只携带该 Token 的请求头，共享的连接池由 close() 统一关闭，这里不关闭客户端
+        http_client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(30.0, read=300.0),
+            follow_redirects=True,
+            transport=self._http_transport(),
+        )
+        try:
+            async with streamable_http_client(MCP_SERVER_URL, http_client=http_client) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    entry.ready.set_result(session)
+                    await entry.stop.wait()
+        except Exception as e:
+            entry.error = e
+            if not entry.ready.done():
+                entry.ready.set_exception(e)
+        finally:
+            if not entry.ready.done():
+                entry.ready.cancel()
+
+    def _evict(self, token, entry):
+        if self._entries.get(token) is entry:
+            del self._entries[token]
+        entry.stop.set()
+
+    def _evict_idle(self, now):
+        for token, entry in list(self._entries.items()):
+            if entry.task.done() or now - entry.last_used > self.idle_timeout:
+                self._evict(token, entry)
+
+    async def call_tool(self, token, headers, tool_name, arguments=None):
+        loop = self._bind_loop()
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        entry = self._entries.get(token)
+        if entry is None:
+            entry = _PooledSession(loop)
+            entry.task = loop.create_task(self._run(entry, headers))
+            self._entries[token] = entry
+            while len(self._entries) > self.max_sessions:
+                old_token, old_entry = next(iter(self._entries.items()))
+                self._evict(old_token, old_entry)
+        self._entries.move_to_end(token)
+        entry.last_used = now
+
+        try:
+            # shield: 某个调用方超时取消时，不能连带取消其他调用方共享的连接过程
+            session = await asyncio.shield(entry.ready)
             if arguments is None:
-                result = await session.call_tool(tool_name)
+                call = asyncio.ensure_future(session.call_tool(tool_name))
             else:
-                result = await session.call_tool(tool_name, arguments=arguments)
+                call = asyncio.ensure_future(session.call_tool(tool_name, arguments=arguments))
+            try:
+                # 连接断开时后台 task 会退出，但挂起的 call_tool 不会被唤醒，所以两者一起等待
+                await asyncio.wait({call, entry.task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if not call.done():
+                    call.cancel()
+            if call.cancelled():
+                raise entry.error or ConnectionError("MCP session closed")
+            return call.result()
+        except Exception:
+            # 会话可能已损坏（连接断开、服务端会话过期等），丢弃后由重试重新建立
+            self._evict(token, entry)
+            raise
+
+    async def close(self):
+        entries = list(self._entries.values())
+        self._entries = OrderedDict()
+        if self._loop is not asyncio.get_running_loop():
+            return
+        for entry in entries:
+            entry.stop.set()
+        tasks = [entry.task for entry in entries if not entry.task.done()]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        transport, self._transport = self._transport, None
+        if transport is not None:
+            await transport.aclose()
+
+
+mcp_pool = MCPPool()
 
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
+async def _request_mcp_with_retry(token, headers, tool_name, arguments):
+    start_ts = time.time()
+    result = await mcp_pool.call_tool(token, headers, tool_name, arguments)
     cost = time.time() - start_ts
     print(f"[MCP] tool={tool_name} finished in {cost:.1f}s")
     return result
@@ -316,20 +452,20 @@ async def call_mcp_tool(token, tool_name, arguments=None, enable_push=False, ret
     print(f"[MCP] Connecting to {MCP_SERVER_URL} tool={tool_name}...")
 
     try:
-        result = await asyncio.wait_for(_request_mcp_with_retry(headers, tool_name, arguments), timeout=60)
+        result = await asyncio.wait_for(_request_mcp_with_retry(token, headers, tool_name, arguments), timeout=60)
 
         if return_raw_content:
             return result.content
 
-        print("\nExecution Result:")
-        result_message = ""
+        parts = []
         for content in result.content:
             if content.type == "text":
-                print(content.text)
-                result_message += content.text + "\n"
+                parts.append(content.text)
             else:
-                print(f"[{content.type}] {content}")
-                result_message += f"[{content.type}] {content}\n"
+                parts.append(f"[{content.type}] {content}")
+        result_message = "\n".join(parts) + "\n" if parts else ""
+        print("\nExecution Result:")
+        print(result_message, end="")
 
         if result_message:
             result_message = cleanup_for_telegram(result_message)
@@ -341,16 +477,20 @@ async def call_mcp_tool(token, tool_name, arguments=None, enable_push=False, ret
         return result_message
                     
     except Exception as e:
-        raw = str(e)
-        lower_raw = raw.lower()
-        if any(kw in lower_raw for kw in ["401", "unauthorized", "403", "forbidden", "invalid token", "token invalid"]):
-            friendly = "[TOKEN_ERROR] 麦当劳 MCP 认证失败，Token 可能已失效或无效，请重新绑定。"
-        elif "429" in raw:
-            friendly = "[SERVER_ERROR] 麦当劳 MCP 接口返回 429（请求过于频繁），请稍后再试。"
-        else:
-            friendly = "[SERVER_ERROR] 麦当劳 MCP 服务当前出现异常，可能在维护或短暂故障，请稍后再试。"
-        print(f"{friendly} 详细信息：{raw}")
-        return friendly
+        return _friendly_mcp_error(e)
+
+def _friendly_mcp_error(e: Exception) -> str:
+    """将 MCP 调用异常转换为带 [TOKEN_ERROR]/[SERVER_ERROR] 前缀的友好提示"""
+    raw = str(e)
+    lower_raw = raw.lower()
+    if any(kw in lower_raw for kw in ["401", "unauthorized", "403", "forbidden", "invalid token", "token invalid"]):
+        friendly = "[TOKEN_ERROR] 麦当劳 MCP 认证失败，Token 可能已失效或无效，请重新绑定。"
+    elif "429" in raw:
+        friendly = "[SERVER_ERROR] 麦当劳 MCP 接口返回 429（请求过于频繁），请稍后再试。"
+    else:
+        friendly = "[SERVER_ERROR] 麦当劳 MCP 服务当前出现异常，可能在维护或短暂故障，请稍后再试。"
+    print(f"{friendly} 详细信息：{raw}")
+    return friendly
 
 def is_mcp_token_error(text: str) -> bool:
     """判断结果是否为 Token 认证相关错误（Token 失效/无效/未授权）"""
@@ -385,13 +525,16 @@ def is_mcp_error_message(text: str) -> bool:
     """判断结果是否为任意 MCP 错误（Token 错误或服务器错误）"""
     return is_mcp_token_error(text) or is_mcp_server_error(text)
 
-def strip_calendar_today_header(text: str) -> str:
-    if not text:
-        return ""
-    raw_lines = text.splitlines()
+def _drop_trailing_blank(lines: list) -> list:
+    # 等价于 "\n".join(lines).splitlines()：拼接再拆分会丢掉末尾的一个空行
+    if lines and lines[-1] == "":
+        return lines[:-1]
+    return lines
+
+def _strip_calendar_today_header_lines(lines: list) -> list:
     cleaned = []
     skipping_first = True
-    for line in raw_lines:
+    for line in lines:
         stripped = line.strip()
         if skipping_first:
             if not stripped:
@@ -401,12 +544,9 @@ def strip_calendar_today_header(text: str) -> str:
                 continue
             skipping_first = False
         cleaned.append(line)
-    return "\n".join(cleaned)
+    return cleaned
 
-def reorder_calendar_sections(text: str) -> str:
-    if not text:
-        return ""
-    lines = text.splitlines()
+def _reorder_calendar_section_lines(lines: list) -> list:
     prefix = []
     sections = []
     current = None
@@ -434,7 +574,7 @@ def reorder_calendar_sections(text: str) -> str:
         sections.append(current)
 
     if not sections:
-        return text
+        return lines
 
     idx_today = None
     idx_yesterday = None
@@ -446,7 +586,7 @@ def reorder_calendar_sections(text: str) -> str:
             idx_yesterday = i
 
     if idx_today is None or idx_yesterday is None:
-        return text
+        return lines
 
     if idx_yesterday < idx_today:
         new_sections = []
@@ -457,15 +597,20 @@ def reorder_calendar_sections(text: str) -> str:
                 new_sections.append(sections[idx_yesterday])
             else:
                 new_sections.append(sec)
-        merged = prefix + [line for sec in new_sections for line in sec]
-        return "\n".join(merged)
+        return prefix + [line for sec in new_sections for line in sec]
 
-    return text
+    return lines
 
-def remove_yesterday_section(text: str) -> str:
+def reorder_calendar_sections(text: str) -> str:
     if not text:
         return ""
     lines = text.splitlines()
+    reordered = _reorder_calendar_section_lines(lines)
+    if reordered is lines:
+        return text
+    return "\n".join(reordered)
+
+def _remove_yesterday_section_lines(lines: list) -> list:
     cleaned = []
     skipping = False
 
@@ -487,7 +632,7 @@ def remove_yesterday_section(text: str) -> str:
         if skipping:
             continue
         cleaned.append(line)
-    return "\n".join(cleaned)
+    return cleaned
 
 async def claim_for_token(token, enable_push=True):
     return await call_mcp_tool(token, "auto-bind-coupons", enable_push=enable_push)
@@ -521,7 +666,6 @@ async def list_campaign_calendar(token, date=None, return_raw=False):
             return content_list
             
         # Try to parse JSON from the first text content
-        import json
         for content in content_list:
             if content.type == 'text':
                 try:
@@ -539,8 +683,26 @@ async def list_campaign_calendar(token, date=None, return_raw=False):
 
     return await call_mcp_tool(token, "campaign-calender", arguments=arguments, enable_push=False)
 
-from quotes import MCD_QUOTES
-from datetime import datetime, timedelta, timezone
+# 按小时索引的时段推荐（10 点为早餐与午餐之间的空档，不给提示）
+_TIME_TIPS = [""] * 24
+for _h in range(5, 10):
+    _TIME_TIPS[_h] = "🍳 早餐时段：来个猪柳蛋堡唤醒灵魂吧"
+for _h in range(11, 14):
+    _TIME_TIPS[_h] = "🍔 午餐时段：1+1随心配，最强穷鬼套餐"
+for _h in range(14, 17):
+    _TIME_TIPS[_h] = "☕ 下午茶时段：工作累了？点杯咖啡配个派"
+for _h in range(17, 21):
+    _TIME_TIPS[_h] = "🍗 晚餐时段：今晚吃顿好的，对自己好一点"
+for _h in (21, 22, 23, 0, 1, 2, 3, 4):
+    _TIME_TIPS[_h] = "🌙 夜宵时段：虽然会胖，但是炸鸡真香啊"
+del _h
+
+# 今日推荐缓存：(token 摘要, 日期, 小时) -> (生成时间, 推荐文本)
+REC_CACHE_TTL = 900
+_REC_CACHE = {}
+
+_HIGHLIGHT_RE = re.compile(r"免费|0元|买一送一|1\+1|半价")
+_STRIP_MD_RE = re.compile(r"\*\*|\\")
 
 async def get_today_recommendation(token):
     if not token or token == "your_token_here":
@@ -550,24 +712,38 @@ async def get_today_recommendation(token):
     cst_now = get_cst_now()
     today = cst_now.strftime("%Y-%m-%d")
     current_hour = cst_now.hour
-   
+
+    # 同一小时内重复 /today 直接复用结果（时段提示按小时变化，所以按小时分桶）
+    cache_key = (hashlib.sha256(token.encode("utf-8")).digest()[:16], today, current_hour)
+    now_ts = time.time()
+    cached = _REC_CACHE.get(cache_key)
+    if cached and now_ts - cached[0] < REC_CACHE_TTL:
+        return cached[1]
+
+    # 两次 MCP 调用互不依赖，并发执行；单个失败时只影响对应的板块
     calendar_text, available_text = await asyncio.gather(
         list_campaign_calendar(token, date=today),
-        list_available_coupons(token)
+        list_available_coupons(token),
+        return_exceptions=True
     )
+    if isinstance(calendar_text, Exception):
+        calendar_text = _friendly_mcp_error(calendar_text)
+    if isinstance(available_text, Exception):
+        available_text = _friendly_mcp_error(available_text)
     
     lines = []
     lines.append(f"📅 {today}")
     
     # 1. 高亮推荐逻辑
     highlights = []
-    if available_text:
-        # 简单关键词匹配
-        if "免费" in available_text or "0元" in available_text:
+    if available_text and not available_text.startswith(MCP_ERROR_PREFIXES):
+        # 简单关键词匹配（一次扫描命中所有关键词）
+        matched = set(_HIGHLIGHT_RE.findall(available_text))
+        if matched & {"免费", "0元"}:
             highlights.append("✨ 发现免费羊毛！赶紧看看列表！")
-        if "买一送一" in available_text or "1+1" in available_text:
+        if matched & {"买一送一", "1+1"}:
             highlights.append("🔥 有买一送活动！适合找人拼单")
-        if "半价" in available_text:
+        if "半价" in matched:
             highlights.append("💰 半价优惠！四舍五入不要钱")
     
     if highlights:
@@ -575,18 +751,7 @@ async def get_today_recommendation(token):
         lines.append("\n".join(highlights))
 
     # 2. 时段推荐逻辑
-    time_tip = ""
-    if 5 <= current_hour < 10:
-        time_tip = "🍳 早餐时段：来个猪柳蛋堡唤醒灵魂吧"
-    elif 11 <= current_hour < 14:
-        time_tip = "🍔 午餐时段：1+1随心配，最强穷鬼套餐"
-    elif 14 <= current_hour < 17:
-        time_tip = "☕ 下午茶时段：工作累了？点杯咖啡配个派"
-    elif 17 <= current_hour < 21:
-        time_tip = "🍗 晚餐时段：今晚吃顿好的，对自己好一点"
-    elif 21 <= current_hour or current_hour < 5:
-        time_tip = "🌙 夜宵时段：虽然会胖，但是炸鸡真香啊"
-        
+    time_tip = _TIME_TIPS[current_hour]
     if time_tip:
         lines.append("")
         lines.append(time_tip)
@@ -605,12 +770,17 @@ async def get_today_recommendation(token):
             lines.append("查询活动信息时出现问题：")
             lines.append(calendar_text.strip())
         else:
-            cal_cleaned = strip_calendar_today_header(calendar_text)
+            # Split once and run every cleanup step on the same line list.
+            # The header is matched on the raw lines, before the Markdown strip
+            cal_lines = _strip_calendar_today_header_lines(calendar_text.splitlines())
             # Remove raw Markdown bold syntax like **Title** and trailing backslashes
-            cal_cleaned = cal_cleaned.replace("**", "").replace("\\", "")
-            cal_cleaned = reorder_calendar_sections(cal_cleaned)
-            cal_cleaned = remove_yesterday_section(cal_cleaned)
-            lines.append(cal_cleaned.strip())
+            cal_lines = _drop_trailing_blank([_STRIP_MD_RE.sub("", line) for line in cal_lines])
+            reordered = _reorder_calendar_section_lines(cal_lines)
+            if reordered is not cal_lines:
+                cal_lines = _drop_trailing_blank(reordered)
+            if any("昨日" in line or "昨天" in line for line in cal_lines):
+                cal_lines = _remove_yesterday_section_lines(cal_lines)
+            lines.append("\n".join(cal_lines).strip())
     
     lines.append("")
     lines.append("━━━━━━━━━━━━━━━━━━━")
@@ -633,39 +803,86 @@ async def get_today_recommendation(token):
         lines.append("当前暂时无法获取活动或优惠券的正常信息，可能是 MCP 服务短暂异常或网络问题，可以稍后再试一次。")
     else:
         # 随机一句麦门文学
-        quote = random.choice(MCD_QUOTES)
+        quote = next_quote()
         lines.append(f"🍟 {quote}")
-        
-    return "\n".join(lines)
+
+    result = "\n".join(lines)
+    # 只缓存两部分都正常获取的结果，出错时下次请求仍会重新查询
+    if not calendar_error and not available_error:
+        for key in [k for k, (ts, _) in _REC_CACHE.items() if now_ts - ts >= REC_CACHE_TTL]:
+            del _REC_CACHE[key]
+        _REC_CACHE[cache_key] = (now_ts, result)
+    return result
+
+def _load_tokens():
+    """读取 MCD_MCP_TOKEN 与 MCD_MCP_TOKENS（逗号分隔），去重并保持顺序"""
+    tokens = []
+    for name in ("MCD_MCP_TOKEN", "MCD_MCP_TOKENS"):
+        for token in (os.getenv(name) or "").split(","):
+            token = token.strip()
+            if token and token not in tokens:
+                tokens.append(token)
+    return tokens
 
 async def main():
-    token = os.getenv("MCD_MCP_TOKEN")
-    if not token:
+    tokens = _load_tokens()
+    if not tokens:
         print("Error: Please set MCD_MCP_TOKEN in .env file")
         return
-    await claim_for_token(token, enable_push=True)
+    # 多个 Token 并发领取，信号量限制同时进行的 MCP 会话数
+    raw_concurrency = os.getenv("MCD_MCP_CONCURRENCY", "5")
+    try:
+        concurrency = int(raw_concurrency)
+    except ValueError:
+        print(f"Warning: invalid MCD_MCP_CONCURRENCY={raw_concurrency!r}, using 5")
+        concurrency = 5
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def claim_one(token):
+        async with semaphore:
+            return await claim_for_token(token, enable_push=True)
+
+    try:
+        results = await asyncio.gather(*(claim_one(t) for t in tokens), return_exceptions=True)
+        for index, result in enumerate(results, 1):
+            if isinstance(result, Exception):
+                print(f"Token #{index} failed: {result}")
+    finally:
+        await mcp_pool.close()
+        await close_http_client()
 
 async def run_task():
     cst_now = get_cst_now()
     print(f"\n[{cst_now.strftime('%Y-%m-%d %H:%M:%S')}] Starting scheduled task...")
     await main()
 
-def job():
-    asyncio.run(run_task())
+def _next_daily_run(now, hour=10, minute=30):
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return target
+
+async def scheduler():
+    """Loop mode: run once on startup, then sleep until 10:30 CST every day on the same event loop."""
+    print("Starting in loop mode. Will run daily at 10:30 AM.")
+    await run_task()
+    last_run_date = None
+    while True:
+        cst_now = get_cst_now()
+        target = _next_daily_run(cst_now)
+        # asyncio.sleep may wake a few ms early; never fire twice for the same day
+        if target.date() == last_run_date:
+            target += timedelta(days=1)
+        await asyncio.sleep((target - cst_now).total_seconds())
+        last_run_date = target.date()
+        try:
+            await run_task()
+        except Exception as e:
+            print(f"Scheduled task failed: {e}")
 
 if __name__ == "__main__":
     # Check if loop mode is enabled
     if len(sys.argv) > 1 and sys.argv[1] == "--loop":
-        print("Starting in loop mode. Will run daily at 10:30 AM.")
-        # Also run immediately on startup
-        job()
-        last_run_date = None
-        while True:
-            cst_now = get_cst_now()
-            if cst_now.hour == 10 and cst_now.minute == 30:
-                if last_run_date != cst_now.date():
-                    job()
-                    last_run_date = cst_now.date()
-            time.sleep(30)
+        asyncio.run(scheduler())
     else:
         asyncio.run(main())
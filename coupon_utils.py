@@ -2,7 +2,10 @@
 优惠券提醒和精选推送模块
 提供优惠券有效期检测、每日精选分析等功能
 """
+import heapq
 import re
+from functools import lru_cache
+from operator import itemgetter
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional
 
@@ -12,6 +15,9 @@ def get_cst_now():
     """获取当前北京时间（带正确的 UTC+8 时区信息）"""
     return datetime.now(CST)
 
+# claim_coupons.call_mcp_tool 等在调用失败时返回的提示前缀，这些文本里不会有优惠券内容
+MCP_ERROR_PREFIXES = ("[TOKEN_ERROR]", "[SERVER_ERROR]", "Error: Invalid Token.")
+
 _MD_BOLD_ITALIC_RE = re.compile(r'(\*{1,3}|_{1,3})(.+?)\1')
 _MD_CODE_RE = re.compile(r'`([^`]+)`')
 
@@ -19,9 +25,14 @@ def clean_markdown_text(text: str) -> str:
     """清理 Markdown 格式文本，只去除 Markdown 语法标记，保留内容。"""
     if not isinstance(text, str):
         return str(text) if text is not None else ""
-    result = _MD_BOLD_ITALIC_RE.sub(r'\2', text)
-    result = _MD_CODE_RE.sub(r'\1', result)
-    result = result.replace("\\", "")
+    # 大部分行没有任何 Markdown 标记，先用子串判断跳过对应的正则替换
+    result = text
+    if "*" in result or "_" in result:
+        result = _MD_BOLD_ITALIC_RE.sub(r'\2', result)
+    if "`" in result:
+        result = _MD_CODE_RE.sub(r'\1', result)
+    if "\\" in result:
+        result = result.replace("\\", "")
     return result.strip()
 
 # Coupon parsing helpers
@@ -33,66 +44,72 @@ _META_LABELS = [
     "\u6709\u6548\u671f", "\u72b6\u6001", "\u5238\u7801", "\u5238\u53f7", "\u4f7f\u7528\u89c4\u5219",
     "\u56fe\u7247", "\u94fe\u63a5", "\u4ef7\u683c", "\u7528\u5238\u4ef7\u683c", "coupon", "code"
 ]
-_GENERIC_NAMES = {
+# 所有关键词合成一个忽略大小写的正则，一次扫描即可判断
+_META_RE = re.compile("|".join(re.escape(kw) for kw in _META_LABELS), re.I)
+_GENERIC_NAMES = frozenset({
     "\u4f18\u60e0", "\u4f18\u60e0\u5238", "\u4f18\u60e0\u5238\u6807\u9898", "\u4f18\u60e0\u5238\u540d\u79f0", "\u5238"
-}
+})
+_GENERIC_NAMES_LOWER = frozenset({"coupon", "coupons"})
 _PRICE_ONLY_RE = re.compile(r'^(?:\u4f18\u60e0|\u7279\u60e0)?\s*¥\s*\d+(?:\.\d+)?$', re.I)
+_TRAIL_PAREN_RE = re.compile(r'[\(（].*?有效.*?[\)）]')
+_EXPIRY_TAIL_RE = re.compile(r'有效期.*')
+_BULLET_PREFIX_RE = re.compile(r'^[\s\-\u2022\*]+')
+_WS_RE = re.compile(r'\s+')
+_PRICE_RE = re.compile(r'¥\s*\d+(\.\d+)?')
+_LABEL_PREFIX_RE = re.compile(r'^([^:\uff1a]{2,80})\s*[:\uff1a]')
+_DATE_IN_TEXT_RE = re.compile(r'\d{4}[-/]\d{1,2}[-/]\d{1,2}')
+_EXPIRY_SPLIT_RE = re.compile(r'(?:\u6709\u6548\u671f|\u6709\u6548\u81f3|\(|\uff08)')
+_DIGIT_RE = re.compile(r'\d')
+_CODE_RE = re.compile(r'(?:couponCode|couponId|\u5238\u7801|\u5238\u53f7|\u5151\u6362\u7801)\s*[:\uff1a]\s*([A-Za-z0-9\-]{3,})', re.I)
 
 
 def _normalize_coupon_name(name: str) -> str:
     name = clean_markdown_text(name)
     # Remove trailing expiry info inside parentheses
-    name = re.sub(r'[\(（].*?有效.*?[\)）]', '', name).strip()
+    name = _TRAIL_PAREN_RE.sub('', name).strip()
     if "有效期" in name:
-        name = re.split(r'有效期.*', name)[0].strip()
-    name = re.sub(r'^[\s\-\u2022\*]+', '', name)
-    name = re.sub(r'\s+', ' ', name).strip()
+        name = _EXPIRY_TAIL_RE.split(name, 1)[0].strip()
+    name = _BULLET_PREFIX_RE.sub('', name)
+    name = _WS_RE.sub(' ', name).strip()
     return name
 
 
 def _is_metadata_label(text: str) -> bool:
-    if not text:
-        return True
-    lowered = text.lower()
-    for kw in _META_LABELS:
-        if kw.lower() in lowered:
-            return True
-    return False
+    return not text or _META_RE.search(text) is not None
 
 
 def _is_generic_coupon_name(name: str) -> bool:
-    if not name:
-        return True
-    if name in _GENERIC_NAMES:
+    if not name or name in _GENERIC_NAMES or name.lower() in _GENERIC_NAMES_LOWER:
         return True
-    lowered = name.lower()
-    compact = re.sub(r'\s+', '', name)
-    if _PRICE_ONLY_RE.match(compact):
-        return True
-    return lowered in {"coupon", "coupons"}
+    compact = _WS_RE.sub('', name)
+    return _PRICE_ONLY_RE.match(compact) is not None
 
 
-def _extract_coupon_name_from_line(line: str) -> str:
+def _extract_coupon_name_from_line(line: str, clean_line: Optional[str] = None) -> str:
     if not line:
         return ""
-    clean_line = clean_markdown_text(line)
-    price_like = re.search(r'¥\s*\d+(\.\d+)?', clean_line)
-    for pat in _NAME_PATTERNS:
-        match = pat.search(clean_line)
-        if match:
-            name = _normalize_coupon_name(match.group(1))
-            if name and not _is_metadata_label(name):
-                return name
-    stripped = re.sub(r'^[\s\-\u2022\*]+', '', clean_line)
+    if clean_line is None:
+        clean_line = clean_markdown_text(line)
+    # 名称/标签类模式都依赖冒号，价格依赖 ¥；先用子串判断，多数行可以跳过这些正则
+    has_colon = ":" in clean_line or "\uff1a" in clean_line
+    price_like = _PRICE_RE.search(clean_line) if "¥" in clean_line else None
+    if has_colon:
+        for pat in _NAME_PATTERNS:
+            match = pat.search(clean_line)
+            if match:
+                name = _normalize_coupon_name(match.group(1))
+                if name and not _is_metadata_label(name):
+                    return name
+    stripped = _BULLET_PREFIX_RE.sub('', clean_line)
     if price_like and len(stripped) <= 80 and not _is_metadata_label(stripped):
-        stripped = re.sub(r'[\(（].*?有效.*?[\)）]', '', stripped).strip()
+        stripped = _TRAIL_PAREN_RE.sub('', stripped).strip()
         if stripped:
             return _normalize_coupon_name(stripped)
     if stripped.startswith("##"):
         name = _normalize_coupon_name(stripped.lstrip("#").strip())
         if name and not _is_metadata_label(name):
             return name
-    match = re.match(r'^([^:\uff1a]{2,80})\s*[:\uff1a]', stripped)
+    match = _LABEL_PREFIX_RE.match(stripped) if has_colon else None
     if match:
         name = _normalize_coupon_name(match.group(1))
         if name and not _is_metadata_label(name):
@@ -101,14 +118,15 @@ def _extract_coupon_name_from_line(line: str) -> str:
     if line.lstrip().startswith(("-", "*", "\u2022")):
         candidate = stripped
         if candidate and len(candidate) <= 80 and not _is_metadata_label(candidate):
-            if not re.search(r'\d{4}[-/]\d{1,2}[-/]\d{1,2}', candidate):
+            if not _DATE_IN_TEXT_RE.search(candidate):
                 return candidate
     return ""
 
-def _extract_detail_from_line(line: str) -> str:
+def _extract_detail_from_line(line: str, clean_line: Optional[str] = None) -> str:
     if not line:
         return ""
-    clean_line = clean_markdown_text(line)
+    if clean_line is None:
+        clean_line = clean_markdown_text(line)
     if ":" in clean_line:
         _, detail = clean_line.split(":", 1)
     elif "\uff1a" in clean_line:
@@ -116,82 +134,115 @@ def _extract_detail_from_line(line: str) -> str:
     else:
         return ""
     detail = detail.strip()
-    detail = re.split(r'(?:\u6709\u6548\u671f|\u6709\u6548\u81f3|\(|\uff08)', detail)[0].strip()
+    detail = _EXPIRY_SPLIT_RE.split(detail, 1)[0].strip()
     if len(detail) < 2:
         return ""
     return detail
 
-def _extract_descriptive_detail(line: str) -> str:
+def _extract_descriptive_detail(line: str, clean_line: Optional[str] = None) -> str:
     if not line:
         return ""
-    clean_line = clean_markdown_text(line)
+    if clean_line is None:
+        clean_line = clean_markdown_text(line)
+    if ":" not in clean_line and "\uff1a" not in clean_line:
+        return ""
     match = _DETAIL_PATTERN.search(clean_line)
     if not match:
         return ""
     detail = match.group(1).strip()
-    detail = re.split(r'(?:\u6709\u6548\u671f|\u6709\u6548\u81f3|\(|\uff08)', detail)[0].strip()
+    detail = _EXPIRY_SPLIT_RE.split(detail, 1)[0].strip()
     if len(detail) < 2:
         return ""
     return detail
 
 
 def _extract_coupon_code(line: str) -> str:
-    if not line:
+    if not line or (":" not in line and "\uff1a" not in line):
         return ""
-    match = re.search(r'(?:couponCode|couponId|\u5238\u7801|\u5238\u53f7|\u5151\u6362\u7801)\s*[:\uff1a]\s*([A-Za-z0-9\-]{3,})', line, re.I)
+    match = _CODE_RE.search(line)
     return match.group(1) if match else ""
 
-def parse_expiry_date(text: str) -> Optional[datetime]:
+# 有效期相关日期格式合并为一个模式，一次扫描即可拿到全部候选：
+#   ymd: 2026-01-25 / 2026/01/25
+#   cn:  01月25日
+#   kw:  有效期至 01-31（只匹配关键词本身，日期放在前瞻里，避免吞掉后面的其他日期）
+_EXPIRY_RE = re.compile(
+    r'(?P<ymd>(?P<year>\d{4})[-/](?P<month>\d{1,2})[-/](?P<day>\d{1,2}))'
+    r'|(?P<cn>(?P<cn_month>\d{1,2})月\s*(?P<cn_day>\d{1,2})日)'
+    r'|(?P<kw>有效期(?=[^\d]*(?P<kw_month>\d{1,2})[-/](?P<kw_day>\d{1,2})))'
+)
+_EXPIRY_CN_RE = re.compile(r'(?P<cn_month>\d{1,2})月\s*(?P<cn_day>\d{1,2})日')
+_EXPIRY_KW_YMD_RE = re.compile(r'(?:有效期|有效期至|有效期到|有效期为|有效期截止)[^\d]*(\d{4})[-/](\d{1,2})[-/](\d{1,2})')
+
+
+def _date_without_year(month: str, day: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    if now is None:
+        now = get_cst_now().replace(tzinfo=None)
+    month, day = int(month), int(day)
+    try:
+        date = datetime(now.year, month, day)
+        # 如果日期已过，可能是明年的
+        if date < now:
+            date = datetime(now.year + 1, month, day)
+        return date
+    except ValueError:
+        return None
+
+
+def parse_expiry_date(text: str, now: Optional[datetime] = None) -> Optional[datetime]:
     """
     从优惠券文本中提取有效期
     支持格式：2026-01-25、2026/01/25、01月25日等
+
+    now: 不带时区的北京时间，用于推断无年份日期；批量解析时由调用方传入，避免每行重新获取
     """
-    now = get_cst_now().replace(tzinfo=None)
-    # 尝试匹配 YYYY-MM-DD 或 YYYY/MM/DD（优先取范围中的最后一天）
-    matches = re.findall(r'(\d{4})[-/](\d{1,2})[-/](\d{1,2})', text)
-    if matches:
-        year, month, day = matches[-1]
+    last_ymd = None
+    first_cn = None
+    first_kw = None
+    for match in _EXPIRY_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == "ymd":
+            last_ymd = match
+        elif kind == "cn":
+            if first_cn is None:
+                first_cn = match
+        elif first_kw is None:
+            first_kw = match
+
+    # 优先取 YYYY-MM-DD 或 YYYY/MM/DD（范围中的最后一天）
+    if last_ymd:
+        year, month, day = last_ymd.group('year', 'month', 'day')
         try:
             return datetime(int(year), int(month), int(day))
         except ValueError:
             pass
-    
-    # 尝试匹配 MM月DD日
-    match = re.search(r'(\d{1,2})月\s*(\d{1,2})日', text)
-    if match:
-        month, day = match.groups()
-        try:
-            year = now.year
-            date = datetime(year, int(month), int(day))
-            # 如果日期已过，可能是明年的
-            if date < now:
-                date = datetime(year + 1, int(month), int(day))
+
+    # 走到这里说明完整日期无效，它可能与紧挨着的 MM月DD日 共用了数字，需单独再找一次
+    if last_ymd:
+        first_cn = _EXPIRY_CN_RE.search(text)
+
+    # MM月DD日
+    if first_cn:
+        date = _date_without_year(*first_cn.group('cn_month', 'cn_day'), now)
+        if date:
             return date
-        except ValueError:
-            pass
-    
-    # 尝试匹配 "有效期至..."
-    match = re.search(r'(?:有效期|有效期至|有效期到|有效期为|有效期截止)[^\d]*(\d{4})[-/](\d{1,2})[-/](\d{1,2})', text)
-    if match:
-        year, month, day = match.groups()
-        try:
-            return datetime(int(year), int(month), int(day))
-        except ValueError:
-            pass
+
+    # "有效期至 YYYY-MM-DD"（同样只在完整日期无效时才可能命中别的日期）
+    if last_ymd and "有效期" in text:
+        match = _EXPIRY_KW_YMD_RE.search(text)
+        if match:
+            year, month, day = match.groups()
+            try:
+                return datetime(int(year), int(month), int(day))
+            except ValueError:
+                pass
 
     # 有效期但无年份：有效期至 01-31
-    match = re.search(r'(?:有效期|有效期至|有效期到|有效期为|有效期截止)[^\d]*(\d{1,2})[-/](\d{1,2})', text)
-    if match:
-        month, day = match.groups()
-        try:
-            year = now.year
-            date = datetime(year, int(month), int(day))
-            if date < now:
-                date = datetime(year + 1, int(month), int(day))
+    if first_kw:
+        date = _date_without_year(*first_kw.group('kw_month', 'kw_day'), now)
+        if date:
             return date
-        except ValueError:
-            pass
-    
+
     return None
 
 def check_expiring_soon(coupons_text: str, days_threshold: int = 3) -> List[Dict]:
@@ -205,6 +256,8 @@ def check_expiring_soon(coupons_text: str, days_threshold: int = 3) -> List[Dict
     Returns:
         即将过期的优惠券列表
     """
+    if not coupons_text or coupons_text.startswith(MCP_ERROR_PREFIXES):
+        return []
     expiring_coupons = []
     now = get_cst_now()
     # Ensure now is naive for comparison if parsed dates are naive, or handle tz
@@ -221,10 +274,7 @@ def check_expiring_soon(coupons_text: str, days_threshold: int = 3) -> List[Dict
     lines = coupons_text.splitlines()
     current_coupon = {}
     
-    def _is_metadata_line(line: str) -> bool:
-        if not line:
-            return False
-        clean = clean_markdown_text(line).strip()
+    def _is_metadata_line(clean: str) -> bool:
         if not clean:
             return False
         check = clean
@@ -235,26 +285,33 @@ def check_expiring_soon(coupons_text: str, days_threshold: int = 3) -> List[Dict
                 return True
         return False
 
+    def _collect(coupon: Dict) -> None:
+        # 券结束时就判断是否在阈值内，不必先收集全部再过滤一遍
+        if 0 <= coupon['days_left'] <= days_threshold:
+            expiring_coupons.append(coupon)
+
     for idx, line in enumerate(lines):
         line = line.strip()
         if not line:
             if current_coupon and current_coupon.get('expiry_date'):
-                expiring_coupons.append(current_coupon)
+                _collect(current_coupon)
                 current_coupon = {}
             continue
-        
+
+        # 每行只清理一次 Markdown，供下面的各个提取函数共用
+        clean_line = clean_markdown_text(line)
         name_candidate = ""
-        if not _is_metadata_line(line):
-            name_candidate = _extract_coupon_name_from_line(line)
+        if not _is_metadata_line(clean_line):
+            name_candidate = _extract_coupon_name_from_line(line, clean_line)
         if name_candidate:
-            if line.lstrip().startswith("##"):
+            if line.startswith("##"):
                 if current_coupon and current_coupon.get('expiry_date'):
-                    expiring_coupons.append(current_coupon)
+                    _collect(current_coupon)
                 current_coupon = {'name': name_candidate, 'raw_text': line}
             else:
                 if current_coupon:
                     if current_coupon.get('expiry_date'):
-                        expiring_coupons.append(current_coupon)
+                        _collect(current_coupon)
                         current_coupon = {'name': name_candidate, 'raw_text': line}
                     elif _is_generic_coupon_name(current_coupon.get('name', '')) and not _is_generic_coupon_name(name_candidate):
                         current_coupon['name'] = name_candidate
@@ -267,11 +324,12 @@ def check_expiring_soon(coupons_text: str, days_threshold: int = 3) -> List[Dict
             current_coupon['code'] = code
 
         if current_coupon and _is_generic_coupon_name(current_coupon.get('name', '')):
-            detail = _extract_descriptive_detail(line) or _extract_detail_from_line(line)
+            detail = _extract_descriptive_detail(line, clean_line) or _extract_detail_from_line(line, clean_line)
             if detail and detail not in current_coupon['name']:
                 current_coupon['name'] = f"{current_coupon['name']} {detail}".strip()
 
-        expiry = parse_expiry_date(line)
+        # 所有日期格式都带数字，没有数字的行不必解析
+        expiry = parse_expiry_date(line, now) if _DIGIT_RE.search(line) else None
         if expiry:
             if not current_coupon:
                 current_coupon = {'name': name_candidate or "", 'raw_text': line}
@@ -282,54 +340,70 @@ def check_expiring_soon(coupons_text: str, days_threshold: int = 3) -> List[Dict
     
     # 添加最后一个
     if current_coupon and current_coupon.get('expiry_date'):
-        expiring_coupons.append(current_coupon)
+        _collect(current_coupon)
     
-    # 过滤：只返回即将过期的
-    result = [
-        c for c in expiring_coupons 
-        if 'expiry_date' in c and 0 <= c['days_left'] <= days_threshold
-    ]
-    
-    return result
+    return expiring_coupons
+
+# Coupon value scoring keywords
+_FREE_RE = re.compile(r'免费|0元')
+_BOGO_RE = re.compile(r'买一送一|1\+1|买1送1')
+_HALF_PRICE_RE = re.compile(r'半价|5折')
+_BIG_DISCOUNT_RE = re.compile(r'19\.9|29\.9|39\.9')
+_SMALL_DISCOUNT_RE = re.compile(r'9\.9|6\.9|4\.9')
+_HOT_ITEM_RE = re.compile(r'巨无霸|麦辣鸡腿堡|薯条|汉堡')
+_LIMITED_RE = re.compile(r'限时|今日')
 
+@lru_cache(maxsize=2048)
 def analyze_coupon_value(coupon_text: str) -> int:
     """
     分析优惠券价值，返回评分（0-100）
     评分标准：免费>买一送一>大额折扣>小额折扣
+    纯函数，同名优惠券每次推送都会重复出现，结果按文本缓存
     """
     score = 50  # 基础分
-    text = coupon_text.lower()
+    # 关键词全是中文、数字和符号，大小写转换不影响匹配，直接在原文上查找
+    text = coupon_text
     
+    # 各项只加分不减分，按权重从高到低判断，一旦封顶就不必再匹配后面的规则
     # 免费类
-    if '免费' in text or '0元' in text:
-        score += 50
+    if _FREE_RE.search(text):
+        return 100
     
     # 买一送一
-    if '买一送一' in text or '1+1' in text or '买1送1' in text:
+    if _BOGO_RE.search(text):
         score += 40
     
     # 半价
-    if '半价' in text or '5折' in text:
+    if _HALF_PRICE_RE.search(text):
         score += 35
+        if score >= 100:
+            return 100
     
     # 大额优惠
-    if any(word in text for word in ['19.9', '29.9', '39.9']):
+    if _BIG_DISCOUNT_RE.search(text):
         score += 25
+        if score >= 100:
+            return 100
     
     # 小额优惠
-    if any(word in text for word in ['9.9', '6.9', '4.9']):
+    if _SMALL_DISCOUNT_RE.search(text):
         score += 15
+        if score >= 100:
+            return 100
     
     # 热门商品
-    if any(word in text for word in ['巨无霸', '麦辣鸡腿堡', '薯条', '汉堡']):
+    if _HOT_ITEM_RE.search(text):
         score += 10
     
     # 限时
-    if '限时' in text or '今日' in text:
+    if _LIMITED_RE.search(text):
         score += 5
     
     return min(score, 100)
 
+_ITEM_BOUNDARY_RE = re.compile(r'^(?:\d+\.|-|##)')
+_ITEM_PREFIX_RE = re.compile(r'^[\d\-•#.\s]+')
+
 def get_daily_highlights(available_coupons_text: str, top_n: int = 5) -> List[Dict]:
     """
     从可领优惠券中筛选出每日精选
@@ -341,6 +415,8 @@ def get_daily_highlights(available_coupons_text: str, top_n: int = 5) -> List[Di
     Returns:
         精选优惠券列表，按价值排序
     """
+    if not available_coupons_text or available_coupons_text.startswith(MCP_ERROR_PREFIXES):
+        return []
     coupons = []
     lines = available_coupons_text.splitlines()
     
@@ -354,11 +430,12 @@ def get_daily_highlights(available_coupons_text: str, top_n: int = 5) -> List[Di
             continue
         
         # 提取优惠券名称
-        if re.match(r'^\d+\.', line) or line.startswith('-') or line.startswith('##'):
+        if _ITEM_BOUNDARY_RE.match(line):
             if current_coupon:
                 coupons.append(current_coupon)
             
-            title = re.sub(r'^[\d\-•#.\s]+', '', line).strip()
+            # line 已去掉首尾空白，前缀正则又吃掉了开头的空白，无需再 strip
+            title = _ITEM_PREFIX_RE.sub('', line)
             current_coupon = {
                 'name': title,
                 'raw_text': line
@@ -371,20 +448,20 @@ def get_daily_highlights(available_coupons_text: str, top_n: int = 5) -> List[Di
     for coupon in coupons:
         coupon['score'] = analyze_coupon_value(coupon['name'])
     
-    # 按分数排序，返回top N
-    sorted_coupons = sorted(coupons, key=lambda x: x['score'], reverse=True)
-    return sorted_coupons[:top_n]
+    # 按分数取 top N（不需要对全部优惠券排序）
+    return heapq.nlargest(top_n, coupons, key=itemgetter('score'))
+
+_SEPARATOR = "━━━━━━━━━━━━━━━━━━━"
+_MEDALS = ("🥇", "🥈", "🥉", "🏅", "⭐")
 
 def format_expiry_reminder(expiring_coupons: List[Dict]) -> str:
     """格式化过期提醒消息"""
     if not expiring_coupons:
         return ""
     
-    SEPARATOR = "━━━━━━━━━━━━━━━━━━━"
-    
     msg_parts = [
         "⏰ 优惠券过期提醒",
-        SEPARATOR,
+        _SEPARATOR,
         "",
         f"你有 {len(expiring_coupons)} 张优惠券即将过期：",
         ""
@@ -402,7 +479,7 @@ def format_expiry_reminder(expiring_coupons: List[Dict]) -> str:
         name = coupon.get('name') or "\u672a\u8bc6\u522b\u5238\u540d"
         expiry_dt = coupon.get('expiry_date')
         if expiry_dt:
-            expiry_str = expiry_dt.strftime('%Y-%m-%d')
+            expiry_str = f"{expiry_dt.year:04d}-{expiry_dt.month:02d}-{expiry_dt.day:02d}"
             msg_parts.append(f"{urgency} {name}(\u6709\u6548\u671f\u81f3 {expiry_str})")
         else:
             msg_parts.append(f"{urgency} {name}")
@@ -416,7 +493,6 @@ def format_daily_highlights(highlights: List[Dict]) -> str:
     if not highlights:
         return ""
     
-    SEPARATOR = "━━━━━━━━━━━━━━━━━━━"
     # Use CST for hour check
     now = get_cst_now()
     current_hour = now.hour
@@ -431,15 +507,14 @@ def format_daily_highlights(highlights: List[Dict]) -> str:
     
     msg_parts = [
         greeting,
-        SEPARATOR,
+        _SEPARATOR,
         "",
         f"根据优惠力度，今天最值得领的 {len(highlights)} 张券：",
         ""
     ]
     
-    medals = ["🥇", "🥈", "🥉", "🏅", "⭐"]
     for i, coupon in enumerate(highlights):
-        medal = medals[i] if i < len(medals) else "📌"
+        medal = _MEDALS[i] if i < len(_MEDALS) else "📌"
         msg_parts.append(f"{medal} {coupon['name']}")
     
     msg_parts.extend([
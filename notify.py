@@ -1,8 +1,10 @@
 import os
+import json
 import httpx
 import logging
 import asyncio
-from tenacity import retry, stop_after_attempt, wait_exponential
+from functools import lru_cache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 
 logger = logging.getLogger(__name__)
 
@@ -18,97 +20,156 @@ def _shorten_message(message: str, limit: int = MAX_PUSH_MESSAGE_LENGTH) -> str:
     return text[: limit - 3] + "..."
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _json_dumps(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+@lru_cache(maxsize=1)
+def _json_text(message: str) -> bytes:
+    """JSON-encode the message once per push; every JSON sender reuses it."""
+    return _json_dumps(message)
+
+
+_http_client = None
+_http_client_loop = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client for the running loop so keep-alive connections are reused."""
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    # Each asyncio.run() gets a new loop, so a client bound to a previous
+    # (closed) loop must not be reused.
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=75),
+            timeout=httpx.Timeout(10.0, connect=5.0),
+        )
+        _http_client_loop = loop
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client, _http_client_loop
+    client = _http_client
+    _http_client = None
+    _http_client_loop = None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """Retry network errors, rate limits and 5xx; a 4xx (bad token, bad chat id) will not fix itself."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+@retry(
+    retry=retry_if_exception(_is_retryable),
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=1, max=10),
+)
 async def _request_with_retry(method: str, url: str, **kwargs):
-    async with httpx.AsyncClient() as client:
-        resp = await client.request(method, url, **kwargs)
-        resp.raise_for_status()
-        return resp
+    client = get_http_client()
+    resp = await client.request(method, url, **kwargs)
+    resp.raise_for_status()
+    return resp
 
 
 async def send_telegram(token, chat_id, message):
     url = f"https://api.telegram.org/bot{token}/sendMessage"
-    base_payload = {
-        "chat_id": chat_id,
-        "text": message,
-    }
-    try:
-        await _request_with_retry("POST", url, json=base_payload)
-        logger.info("Telegram notification sent successfully.")
-    except Exception as e:
-        logger.error(f"Failed to send Telegram notification: {e}")
+    body = b'{"chat_id":%s,"text":%s}' % (_json_dumps(chat_id), _json_text(message))
+    await _request_with_retry("POST", url, content=body, headers=_JSON_HEADERS)
+    logger.info("Telegram notification sent successfully.")
 
 
 async def send_bark(key, message):
     url = f"https://api.day.app/{key}"
-    payload = {
-        "title": "McDonalds Coupon",
-        "body": message,
-    }
-    try:
-        await _request_with_retry("POST", url, json=payload)
-        logger.info("Bark notification sent successfully.")
-    except Exception as e:
-        logger.error(f"Failed to send Bark notification: {e}")
+    body = b'{"title":"McDonalds Coupon","body":%s}' % _json_text(message)
+    await _request_with_retry("POST", url, content=body, headers=_JSON_HEADERS)
+    logger.info("Bark notification sent successfully.")
 
 
 async def send_feishu(webhook, message):
-    payload = {
-        "msg_type": "text",
-        "content": {
-            "text": message,
-        },
-    }
-    try:
-        await _request_with_retry("POST", webhook, json=payload)
-        logger.info("Feishu notification sent successfully.")
-    except Exception as e:
-        logger.error(f"Failed to send Feishu notification: {e}")
+    body = b'{"msg_type":"text","content":{"text":%s}}' % _json_text(message)
+    await _request_with_retry("POST", webhook, content=body, headers=_JSON_HEADERS)
+    logger.info("Feishu notification sent successfully.")
 
 
 async def send_serverchan(sendkey, message):
     url = f"https://sctapi.ftqq.com/{sendkey}.send"
-    payload = {
-        "title": "McDonalds Coupon Report",
-        "desp": message,
-    }
-    try:
-        await _request_with_retry("POST", url, data=payload)
-        logger.info("ServerChan notification sent successfully.")
-    except Exception as e:
-        logger.error(f"Failed to send ServerChan notification: {e}")
+    body = b'{"title":"McDonalds Coupon Report","desp":%s}' % _json_text(message)
+    await _request_with_retry("POST", url, content=body, headers=_JSON_HEADERS)
+    logger.info("ServerChan notification sent successfully.")
 
 
-async def push_all(message):
-    text = _shorten_message(message)
-    tasks = []
+_notifiers = None
+
+
+def _get_notifiers():
+    """Build the (name, sender, args) table from the environment once.
 
-    tg_token = os.getenv("TG_BOT_TOKEN")
-    tg_chat_id = os.getenv("TG_CHAT_ID")
-    if tg_token and tg_chat_id:
-        tasks.append(send_telegram(tg_token, tg_chat_id, text))
+    Built on first use rather than at import so that load_dotenv() in the
+    importing module has already run.
+    """
+    global _notifiers
+    if _notifiers is None:
+        notifiers = []
+        tg_token = os.getenv("TG_BOT_TOKEN")
+        tg_chat_id = os.getenv("TG_CHAT_ID")
+        if tg_token and tg_chat_id:
+            notifiers.append(("Telegram", send_telegram, (tg_token, tg_chat_id)))
 
-    bark_key = os.getenv("BARK_KEY")
-    if bark_key:
-        tasks.append(send_bark(bark_key, text))
+        bark_key = os.getenv("BARK_KEY")
+        if bark_key:
+            notifiers.append(("Bark", send_bark, (bark_key,)))
 
-    feishu_webhook = os.getenv("FEISHU_WEBHOOK")
-    if feishu_webhook:
-        tasks.append(send_feishu(feishu_webhook, text))
+        feishu_webhook = os.getenv("FEISHU_WEBHOOK")
+        if feishu_webhook:
+            notifiers.append(("Feishu", send_feishu, (feishu_webhook,)))
 
-    serverchan_key = os.getenv("SERVERCHAN_SENDKEY")
-    if serverchan_key:
-        tasks.append(send_serverchan(serverchan_key, text))
+        serverchan_key = os.getenv("SERVERCHAN_SENDKEY")
+        if serverchan_key:
+            notifiers.append(("ServerChan", send_serverchan, (serverchan_key,)))
+        _notifiers = notifiers
+    return _notifiers
 
-    if tasks:
-        await asyncio.gather(*tasks)
-    else:
+
+async def push_all(message):
+    notifiers = _get_notifiers()
+    if not notifiers:
         logger.info("No notification services configured. Skipping push.")
+        return
+
+    text = _shorten_message(message)
+    if not text.strip():
+        logger.info("Empty notification, skipping push.")
+        return
+    # Senders raise on failure; collect the errors here so one bad endpoint
+    # never cancels or hides the others.
+    results = await asyncio.gather(
+        *(sender(*args, text) for _, sender, args in notifiers),
+        return_exceptions=True,
+    )
+    for (name, _, _), result in zip(notifiers, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to send {name} notification: {result}")
 
 
 if __name__ == "__main__":
-    import asyncio
     from dotenv import load_dotenv
 
     load_dotenv()
-    asyncio.run(push_all("Test message from McDonalds Script"))
+
+    async def _test_push():
+        try:
+            await push_all("Test message from McDonalds Script")
+        finally:
+            await close_http_client()
+
+    asyncio.run(_test_push())
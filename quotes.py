@@ -1,3 +1,4 @@
+import random
 
 MCD_QUOTES = [
     "麦门！🙏",
@@ -21,3 +22,11 @@ MCD_QUOTES = [
     "信仰金拱门，永远不沉沦。",
     "麦当劳不是快餐，是救赎。"
 ]
+
+_quote_bag = []
+
+def next_quote():
+    """Next quote from a shuffled bag: every quote is shown once before any repeats."""
+    if not _quote_bag:
+        _quote_bag.extend(random.sample(MCD_QUOTES, len(MCD_QUOTES)))
+    return _quote_bag.pop()
@@ -1,9 +1,11 @@
-import httpx
 import json
 import os
 import re
 from tenacity import retry, stop_after_attempt, wait_exponential
 from coupon_utils import get_cst_now, clean_markdown_text
+from notify import get_http_client
+
+_DATE_YMD_RE = re.compile(r'(\d{4})[-/](\d{1,2})[-/](\d{1,2})')
 
 class TelegraphService:
     BASE_URL = "https://api.telegra.ph"
@@ -16,47 +18,50 @@ class TelegraphService:
         # but for now we can create a new one or keep it in memory.
         # Ideally, we should cache this token.
         token_dir = os.path.join("data")
-        if not os.path.exists(token_dir):
-            try:
-                os.makedirs(token_dir)
-            except Exception as e:
-                print(f"Error creating telegraph token directory: {e}")
-                token_dir = "."
+        try:
+            os.makedirs(token_dir, exist_ok=True)
+        except Exception as e:
+            print(f"Error creating telegraph token directory: {e}")
+            token_dir = "."
         self.token_file = os.path.join(token_dir, "telegraph_token.json")
         self._load_token()
 
     def _load_token(self):
-        if os.path.exists(self.token_file):
-            try:
-                with open(self.token_file, "r") as f:
-                    data = json.load(f)
-                    self.access_token = data.get("access_token")
-            except Exception as e:
-                print(f"Error loading telegraph token: {e}")
+        try:
+            with open(self.token_file, "r") as f:
+                data = json.load(f)
+                self.access_token = data.get("access_token")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading telegraph token: {e}")
 
     def _save_token(self, token):
         self.access_token = token
         try:
-            with open(self.token_file, "w") as f:
+            # Write then rename, so a crash mid-write can't leave a truncated token file
+            tmp_file = self.token_file + ".tmp"
+            with open(tmp_file, "w") as f:
                 json.dump({"access_token": token}, f)
+            os.replace(tmp_file, self.token_file)
         except Exception as e:
             print(f"Error saving telegraph token: {e}")
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
     async def create_account(self):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.BASE_URL}/createAccount",
-                params={
-                    "short_name": self.short_name,
-                    "author_name": self.author_name
-                }
-            )
-            data = response.json()
-            if data.get("ok"):
-                self._save_token(data["result"]["access_token"])
-                return self.access_token
-            raise Exception(f"Failed to create Telegraph account: {data}")
+        client = get_http_client()
+        response = await client.get(
+            f"{self.BASE_URL}/createAccount",
+            params={
+                "short_name": self.short_name,
+                "author_name": self.author_name
+            }
+        )
+        data = response.json()
+        if data.get("ok"):
+            self._save_token(data["result"]["access_token"])
+            return self.access_token
+        raise Exception(f"Failed to create Telegraph account: {data}")
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
     async def create_page(self, title, content_nodes):
@@ -69,21 +74,23 @@ class TelegraphService:
             if not self.access_token:
                 return None
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            content_json = json.dumps(content_nodes)
-            response = await client.post(
-                f"{self.BASE_URL}/createPage",
-                data={
-                    "access_token": self.access_token,
-                    "title": title,
-                    "content": content_json,
-                    "return_content": False
-                }
-            )
-            data = response.json()
-            if data.get("ok"):
-                return data["result"]["url"]
-            raise Exception(f"Failed to create Telegraph page: {data}")
+        # Serialise before touching the client so bad input fails without taking a connection
+        content_json = json.dumps(content_nodes)
+        client = get_http_client()
+        response = await client.post(
+            f"{self.BASE_URL}/createPage",
+            data={
+                "access_token": self.access_token,
+                "title": title,
+                "content": content_json,
+                "return_content": False
+            },
+            timeout=30.0
+        )
+        data = response.json()
+        if data.get("ok"):
+            return data["result"]["url"]
+        raise Exception(f"Failed to create Telegraph page: {data}")
 
     @staticmethod
     def _clean_text(text):
@@ -95,7 +102,7 @@ class TelegraphService:
             return None
         if not isinstance(value, str):
             value = str(value)
-        match = re.search(r'(\d{4})[-/](\d{1,2})[-/](\d{1,2})', value)
+        match = _DATE_YMD_RE.search(value)
         if not match:
             return None
         year, month, day = match.groups()
@@ -131,48 +138,7 @@ class TelegraphService:
             ...
         ]
         """
-        nodes = []
-        
-        # Intro
-        nodes.append({"tag": "p", "children": ["麦当劳近期活动一览："]})
-        nodes.append({"tag": "hr"})
-
-        calendar_items = TelegraphService.sort_calendar_items(calendar_data)
-        for item in calendar_items:
-            # Item Title
-            title = TelegraphService._clean_text(item.get("title", "未知活动"))
-            nodes.append({"tag": "h3", "children": [title]})
-            
-            # Date
-            start = item.get("start", "")
-            end = item.get("end", "")
-            if start or end:
-                date_str = f"{start} - {end}"
-                nodes.append({"tag": "p", "children": [
-                    {"tag": "b", "children": ["活动时间: "]},
-                    date_str
-                ]})
-
-            # Content
-            content = item.get("content") or item.get("desc")
-            if content:
-                nodes.append({"tag": "p", "children": [{"tag": "b", "children": ["活动详情:"]}]})
-                for line in str(content).splitlines():
-                    l = TelegraphService._clean_text(line)
-                    if not l:
-                        continue
-                    nodes.append({"tag": "p", "children": [l]})
-
-            # Image
-            image_url = item.get("image") or item.get("imageUrl") or item.get("img")
-            if image_url:
-                nodes.append({"tag": "figure", "children": [
-                    {"tag": "img", "attrs": {"src": image_url}},
-                    {"tag": "figcaption", "children": ["活动海报"]}
-                ]})
-            
-            nodes.append({"tag": "hr"})
-
+        nodes = _calendar_body_nodes(calendar_data)
 
         cst_now = get_cst_now()
         footer_time = cst_now.strftime("%Y-%m-%d %H:%M")
@@ -181,3 +147,59 @@ class TelegraphService:
             {"tag": "i", "children": [f"Generated by McdBot • {footer_time}"]}
         ]})
         return nodes
+
+
+# Every item field _item_nodes renders
+_RENDERED_FIELDS = ("title", "start", "end", "content", "desc", "image", "imageUrl", "img")
+
+
+def _item_nodes(item):
+    """Telegraph nodes for one calendar entry."""
+    # Item Title
+    title = TelegraphService._clean_text(item.get("title", "未知活动"))
+    nodes = [{"tag": "h3", "children": [title]}]
+
+    # Date
+    start = item.get("start", "")
+    end = item.get("end", "")
+    if start or end:
+        nodes.append({"tag": "p", "children": [
+            {"tag": "b", "children": ["活动时间: "]},
+            f"{start} - {end}"
+        ]})
+
+    # Content
+    content = item.get("content") or item.get("desc")
+    if content:
+        nodes.append({"tag": "p", "children": [{"tag": "b", "children": ["活动详情:"]}]})
+        cleaned = (TelegraphService._clean_text(line) for line in str(content).splitlines())
+        nodes.extend({"tag": "p", "children": [l]} for l in cleaned if l)
+
+    # Image
+    image_url = item.get("image") or item.get("imageUrl") or item.get("img")
+    if image_url:
+        nodes.append({"tag": "figure", "children": [
+            {"tag": "img", "attrs": {"src": image_url}},
+            {"tag": "figcaption", "children": ["活动海报"]}
+        ]})
+
+    nodes.append({"tag": "hr"})
+    return nodes
+
+
+def _calendar_body_nodes(calendar_data):
+    """Intro plus item nodes for a calendar payload."""
+    # Intro
+    nodes = [{"tag": "p", "children": ["麦当劳近期活动一览："]}, {"tag": "hr"}]
+    seen = set()
+    for item in TelegraphService.sort_calendar_items(calendar_data):
+        # Entries with nothing to show would only render as "未知活动" plus a rule
+        if not any(item.get(k) for k in _RENDERED_FIELDS):
+            continue
+        # Upstream can repeat the same campaign (e.g. once per city); show it once
+        identity = json.dumps([item.get(k) for k in _RENDERED_FIELDS], ensure_ascii=False, default=str)
+        if identity in seen:
+            continue
+        seen.add(identity)
+        nodes.extend(_item_nodes(item))
+    return nodes